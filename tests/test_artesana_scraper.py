@@ -0,0 +1,132 @@
+"""
+Pruebas de regresión de utilities/artesana_scraper.py
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from artesana_scraper import ArtesanaScraper, CatalogExporter
+
+CATEGORY = {'name': 'Bolsas', 'slug': 'bolsas'}
+
+def make_scraper() -> ArtesanaScraper:
+    return ArtesanaScraper(cache_dir=None, quiet=True)
+
+def test_csv_rows_old_report_without_downloads():
+    """Entrada de un reporte --dry-run anterior: sin variant_downloads ni imágenes descargadas"""
+    product = {'name': 'Bolsa MXN $480.00', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/',
+               'variants': {'Rosa': ['http://x/rosa.jpg'], 'Azul': ['http://x/azul.jpg']},
+               'downloaded_images': []}
+    
+    rows = make_scraper().csv_rows(CATEGORY, product)
+    
+    assert [row['variante'] for row in rows] == ['Rosa', 'Azul']
+    assert all(row['imagenes_descargadas'] == 0 and row['rutas_descargadas'] == '' for row in rows)
+    assert rows[0]['precio'] == 'MXN $480.00'
+
+def test_csv_rows_old_report_matches_files_by_variant_name():
+    """Reporte anterior al índice por variante: el archivo se busca por el nombre de la variante"""
+    product = {'name': 'Bolsa', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/',
+               'variants': {'Rosa': ['http://x/rosa.jpg'], 'Azul': ['http://x/azul.jpg']},
+               'downloaded_images': ['scraper/Bolsas/Bolsa/principal.jpg', 'scraper/Bolsas/Bolsa/Rosa.jpg']}
+    
+    rows = make_scraper().csv_rows(CATEGORY, product)
+    
+    assert rows[0]['rutas_descargadas'] == 'scraper/Bolsas/Bolsa/Rosa.jpg'
+    assert rows[1]['rutas_descargadas'] == ''
+
+def test_merge_previous_report_keeps_entry_when_fetch_failed():
+    """Una página que falla en un --since-report no borra la entrada del reporte anterior"""
+    good = {'name': 'Bolsa', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/',
+            'variants': {'Rosa': ['http://x/rosa.jpg']}, 'downloaded_images': ['scraper/Bolsas/Bolsa/Rosa.jpg']}
+    failed = {'name': 'Bolsa', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/', 'variants': {},
+              'main_image': None, 'downloaded_images': [], 'variant_downloads': {}, 'fetch_failed': True}
+    previous_report = {'categories': [dict(CATEGORY, products=[good])]}
+    results = {'categories': [dict(CATEGORY, products=[failed])], 'total_products': 1, 'total_images': 0,
+               'errors': [], 'recovered': []}
+    
+    make_scraper()._merge_previous_report(results, previous_report, {'bolsas': [{'slug': 'bolsa'}]})
+    
+    assert results['categories'][0]['products'] == [good]
+    assert results['incremental']['changed'] == 0 and results['incremental']['failed'] == 1
+    assert results['total_images'] == 1
+
+def export_sqlite(db_path, *products):
+    exporter = CatalogExporter([CATEGORY], [(CATEGORY, product) for product in products], batch_size=2)
+    exporter.write_sqlite(str(db_path))
+    return exporter
+
+def catalog_product(**overrides):
+    product = {'name': 'Bolsa MXN $480.00', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/',
+               'main_image': 'http://x/bolsa.jpg', 'fingerprint': 'abc',
+               'variants': {'Rosa': ['http://x/rosa.jpg'], 'Azul': ['http://x/azul.jpg']},
+               'downloaded_images': [], 'variant_downloads': {}}
+    product.update(overrides)
+    return product
+
+def test_export_sqlite_upsert_is_idempotent(tmp_path):
+    db_path = tmp_path / 'catalogo.db'
+    export_sqlite(db_path, catalog_product(), catalog_product(slug='cartera', name='Cartera $250'))
+    export_sqlite(db_path, catalog_product(), catalog_product(slug='cartera', name='Cartera $250'))
+    
+    connection = sqlite3.connect(db_path)
+    assert connection.execute('SELECT count(*) FROM categories').fetchone() == (1,)
+    assert connection.execute('SELECT name, price FROM products ORDER BY id').fetchall() == [
+        ('Bolsa', 480), ('Cartera', 250)]
+    assert connection.execute('SELECT id, variant_name, is_active FROM product_variants ORDER BY id').fetchall() == [
+        ('1-0', 'Rosa', 1), ('1-1', 'Azul', 1), ('2-0', 'Rosa', 1), ('2-1', 'Azul', 1)]
+
+def test_export_sqlite_deactivates_removed_variants(tmp_path):
+    db_path = tmp_path / 'catalogo.db'
+    export_sqlite(db_path, catalog_product())
+    export_sqlite(db_path, catalog_product(variants={'Rosa': ['http://x/rosa.jpg']}))
+    
+    connection = sqlite3.connect(db_path)
+    assert connection.execute('SELECT id, is_active FROM product_variants ORDER BY id').fetchall() == [
+        ('1-0', 1), ('1-1', 0)]
+
+def test_export_sqlite_skips_fetch_failed_products(tmp_path):
+    db_path = tmp_path / 'catalogo.db'
+    export_sqlite(db_path, catalog_product())
+    exporter = export_sqlite(db_path, catalog_product(variants={}, main_image=None, fetch_failed=True))
+    
+    connection = sqlite3.connect(db_path)
+    assert exporter.counts['skipped'] == 1
+    assert connection.execute('SELECT main_image_url, has_variants FROM products').fetchall() == [
+        ('http://x/bolsa.jpg', 1)]
+    assert connection.execute('SELECT sum(is_active) FROM product_variants').fetchone() == (2,)
+
+def test_load_product_refetches_failed_entry_despite_lastmod(monkeypatch):
+    """El atajo del lastmod del sitemap no reutiliza una entrada que falló"""
+    scraper = make_scraper()
+    fetched = []
+    monkeypatch.setattr(scraper, 'get_product_variants_and_images',
+                        lambda product, previous=None: fetched.append(product['url']) or {'variants': {'Rosa': []}})
+    product = {'name': 'Bolsa', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/', 'lastmod': '2024-06-01'}
+    
+    info = scraper._load_product(product, {'lastmod': '2024-06-01', 'variants': {}, 'fetch_failed': True})
+    
+    assert fetched == [product['url']] and not info.get('unchanged')
+    assert scraper._load_product(product, {'lastmod': '2024-06-01', 'variants': {'Rosa': []}})['unchanged']
+
+FALLBACK_PAGE = b'''<html><body>
+<h1 class="product_title">Bolsa Negro</h1>
+<div class="woocommerce-product-gallery"><img src="/wp-content/uploads/bolsa.jpg"></div>
+<div class="woocommerce-Tabs-panel--description"><p>Disponible en negro y rosa.</p>
+<img src="/wp-content/uploads/bolsa-detalle.jpg"></div>
+</body></html>'''
+
+def test_fallback_uses_full_document_with_restricted_parse(monkeypatch):
+    """Sin swatches, los colores y las imágenes se buscan fuera de los contenedores del strainer"""
+    scraper = ArtesanaScraper(base_url='http://x', cache_dir=None, quiet=True)
+    monkeypatch.setattr(scraper, '_fetch_page', lambda url: FALLBACK_PAGE)
+    product = {'name': 'Bolsa Negro', 'slug': 'bolsa', 'url': 'http://x/product/bolsa/'}
+    
+    restricted = scraper.get_product_variants_and_images(product)
+    full = scraper.extract_product_data(scraper.parse_html(FALLBACK_PAGE), product)
+    
+    assert set(restricted['variants']) == {'Negro', 'Rosa'}
+    assert restricted['variants'] == full['variants']
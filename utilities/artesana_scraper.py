@@ -5,7 +5,9 @@ Descarga imágenes de productos organizadas por Categoria/producto/variante
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve as sv
 import os
 import urllib.parse
 from pathlib import Path
@@ -15,26 +17,1418 @@ import argparse
 from typing import List, Dict, Tuple
 import re
 import csv
+import shutil
+import hashlib
+import io
+import xml.etree.ElementTree as ET
+import tempfile
+import uuid
+import random
+import math
+import email.utils
+import threading
+import queue
+import heapq
+import sqlite3
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import httpx  # opcional: cliente HTTP/2 para --http2
+except ImportError:
+    httpx = None
+
+try:
+    from PIL import Image  # opcional: derivados WebP y miniaturas (--webp, --thumbnails)
+except ImportError:
+    Image = None
+
+try:
+    import brotli  # opcional: urllib3 descomprime br si está instalado
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# Subárboles que necesita cada etapa; el resto del documento no se construye
+CATEGORY_LINKS = SoupStrainer('a', href=re.compile(r'/product-category/'))
+PRODUCT_LINKS = SoupStrainer('a', href=re.compile(r'/product/|/page/\d+'))
+# Reglas de la página de producto (selectores, swatches, fallback); ver ExtractionRules
+DEFAULT_RULES = Path(__file__).resolve().parent / 'extraction_rules.json'
+
+# Sitemaps de WordPress core y de Yoast/WooCommerce, en orden de preferencia
+SITEMAP_PATHS = ['/wp-sitemap.xml', '/sitemap_index.xml', '/product-sitemap.xml']
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+PAGE_NUMBER = re.compile(r'/page/(\d+)/?$')
+# Columnas de productos_scrapeados.csv
+CSV_FIELDS = ['categoria', 'categoria_slug', 'producto', 'producto_slug', 'variante', 'precio',
+              'total_imagenes', 'imagenes_descargadas', 'urls_imagenes', 'rutas_descargadas', 'rutas_derivados']
+# Precio numérico dentro de "MXN $1,480.00"
+PRICE_NUMBER = re.compile(r'\$\s*([\d,]+(?:\.\d+)?)')
+# Tablas mínimas del catálogo de Supabase para el destino SQLite de --export-sqlite
+SQLITE_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT NOT NULL, slug TEXT UNIQUE,
+                                       is_active BOOLEAN DEFAULT TRUE);
+CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, name TEXT NOT NULL, slug TEXT UNIQUE, price NUMERIC,
+                                     main_image_url TEXT, permalink TEXT, category_id INTEGER REFERENCES categories(id),
+                                     has_variants BOOLEAN DEFAULT FALSE, updated_at TIMESTAMP);
+CREATE TABLE IF NOT EXISTS product_variants (id TEXT PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES products(id),
+                                             variant_name TEXT NOT NULL, variant_value TEXT NOT NULL,
+                                             variant_type TEXT DEFAULT 'color', image_url TEXT,
+                                             sort_order INTEGER DEFAULT 0, is_active BOOLEAN DEFAULT TRUE,
+                                             updated_at TIMESTAMP);
+"""
+# Respuestas transitorias que vale la pena reintentar
+RETRY_STATUS = {429, 502, 503, 504}
+# Sufijos que WordPress agrega a las copias redimensionadas: foto-300x300.jpg, foto-scaled.jpg
+WP_SIZE_SUFFIX = re.compile(r'-(\d+x\d+|scaled)(?=\.[A-Za-z0-9]+$)')
+
+class RateLimiter:
+    """Token bucket por host, compartido entre todos los hilos.
+    
+    Se adapta al servidor (AIMD): baja la tasa a la mitad ante 429/503 o un
+    pico de latencia, respeta Retry-After bloqueando el host, y la recupera
+    poco a poco hasta `requests_per_second` mientras las respuestas van bien.
+    """
+    
+    def __init__(self, requests_per_second: float = 1.0, burst: float = 1.0, adaptive: bool = True):
+        self.max_rate = requests_per_second
+        self.min_rate = requests_per_second / 8
+        self.burst = burst
+        self.adaptive = adaptive
+        self.lock = threading.Lock()
+        self.hosts = {}
+    
+    def _host(self, url: str) -> Dict:
+        host = urllib.parse.urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = {'rate': self.max_rate, 'tokens': self.burst, 'updated': time.monotonic(),
+                                'blocked_until': 0.0, 'latency': None}
+        return self.hosts[host]
+    
+    def wait(self, url: str) -> None:
+        """Bloquea hasta que el host de la URL tenga un token disponible"""
+        while True:
+            with self.lock:
+                state = self._host(url)
+                now = time.monotonic()
+                if state['blocked_until'] > now:
+                    pause = state['blocked_until'] - now
+                elif not state['rate']:
+                    return
+                else:
+                    state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * state['rate'])
+                    state['updated'] = now
+                    if state['tokens'] >= 1:
+                        state['tokens'] -= 1
+                        return
+                    pause = (1 - state['tokens']) / state['rate']
+            time.sleep(pause)
+    
+    def feedback(self, url: str, latency: float = None, status: int = None, retry_after: float = None) -> None:
+        """Ajusta la tasa del host según el resultado de un request"""
+        with self.lock:
+            state = self._host(url)
+            if retry_after:
+                state['blocked_until'] = max(state['blocked_until'], time.monotonic() + retry_after)
+            if not self.adaptive or not state['rate']:
+                return
+            
+            average = state['latency']
+            congested = status in (429, 503) or latency is None
+            if latency is not None:
+                congested = congested or (average is not None and latency > 2 * average)
+                state['latency'] = latency if average is None else 0.8 * average + 0.2 * latency
+            
+            if congested:
+                state['rate'] = max(self.min_rate, state['rate'] / 2)
+            else:
+                state['rate'] = min(self.max_rate, state['rate'] + self.max_rate * 0.1)
+
+class StageProfiler:
+    """Métricas por etapa del crawl: conteos, latencias (p50/p95/p99) y bytes.
+    
+    Se exporta como JSON (`to_dict`) junto a scraping_report.json y,
+    opcionalmente, en formato de texto de Prometheus.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        # Etapas abiertas en cada hilo, para descontarles las esperas
+        self.local = threading.local()
+    
+    def _open_stages(self) -> List[Dict]:
+        if not hasattr(self.local, 'open'):
+            self.local.open = []
+        return self.local.open
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Mide un bloque; el llamador puede sumar bytes en metrics['bytes'].
+        
+        El tiempo medido con `wait` dentro del bloque no se le cuenta.
+        """
+        metrics = {'bytes': 0, 'waited': 0.0}
+        open_stages = self._open_stages()
+        open_stages.append(metrics)
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            open_stages.pop()
+            self.record(name, time.perf_counter() - start - metrics['waited'], metrics['bytes'])
+    
+    @contextmanager
+    def wait(self, name: str):
+        """Mide una espera (límite de tasa, backoff) como etapa propia, fuera de la latencia de red"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.record(name, seconds)
+            for metrics in self._open_stages():
+                metrics['waited'] += seconds
+    
+    def record(self, name: str, seconds: float, nbytes: int = 0) -> None:
+        with self.lock:
+            stage = self.stages.setdefault(name, {'samples': [], 'bytes': 0})
+            stage['samples'].append(seconds)
+            stage['bytes'] += nbytes
+    
+    def merge(self, stages: Dict) -> None:
+        """Suma las muestras de otro perfilador (por ejemplo, el de un proceso de --processes)"""
+        with self.lock:
+            for name, other in stages.items():
+                stage = self.stages.setdefault(name, {'samples': [], 'bytes': 0})
+                stage['samples'].extend(other['samples'])
+                stage['bytes'] += other['bytes']
+    
+    @staticmethod
+    def _percentile(ordered: List[float], fraction: float) -> float:
+        if not ordered:
+            return 0.0
+        # Percentil por rango más cercano
+        index = max(0, math.ceil(fraction * len(ordered)) - 1)
+        return ordered[index]
+    
+    def to_dict(self) -> Dict:
+        wall_time = time.perf_counter() - self.started
+        profile = {'wall_time_s': round(wall_time, 3), 'stages': {}}
+        with self.lock:
+            for name, stage in self.stages.items():
+                ordered = sorted(stage['samples'])
+                total = sum(ordered)
+                profile['stages'][name] = {
+                    'count': len(ordered),
+                    'total_s': round(total, 3),
+                    'p50_ms': round(self._percentile(ordered, 0.50) * 1000, 2),
+                    'p95_ms': round(self._percentile(ordered, 0.95) * 1000, 2),
+                    'p99_ms': round(self._percentile(ordered, 0.99) * 1000, 2),
+                    'bytes': stage['bytes'],
+                    'per_second': round(len(ordered) / wall_time, 2) if wall_time else 0.0
+                }
+        
+        # Páginas e imágenes pedidas por segundo de reloj
+        request_count = sum(profile['stages'].get(name, {}).get('count', 0) for name in ('fetch_page', 'download_image'))
+        profile['requests_per_second'] = round(request_count / wall_time, 2) if wall_time else 0.0
+        return profile
+    
+    def to_prometheus(self) -> str:
+        """Perfil en formato de exposición de texto de Prometheus"""
+        profile = self.to_dict()
+        lines = [
+            '# HELP artesana_stage_seconds Duración de cada etapa del scraper',
+            '# TYPE artesana_stage_seconds summary'
+        ]
+        for name, stage in profile['stages'].items():
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'artesana_stage_seconds{{stage="{name}",quantile="{quantile}"}} {round(stage[key] / 1000, 6)}')
+            lines.append(f'artesana_stage_seconds_sum{{stage="{name}"}} {stage["total_s"]}')
+            lines.append(f'artesana_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append('# HELP artesana_stage_bytes_total Bytes transferidos o escritos por etapa')
+        lines.append('# TYPE artesana_stage_bytes_total counter')
+        for name, stage in profile['stages'].items():
+            lines.append(f'artesana_stage_bytes_total{{stage="{name}"}} {stage["bytes"]}')
+        lines.append('# HELP artesana_requests_per_second Páginas e imágenes pedidas por segundo')
+        lines.append('# TYPE artesana_requests_per_second gauge')
+        lines.append(f'artesana_requests_per_second {profile["requests_per_second"]}')
+        lines.append('# HELP artesana_wall_time_seconds Duración total de la ejecución')
+        lines.append('# TYPE artesana_wall_time_seconds gauge')
+        lines.append(f'artesana_wall_time_seconds {profile["wall_time_s"]}')
+        return '\n'.join(lines) + '\n'
+
+class DownloadPipeline:
+    """Cola de descargas de imágenes atendida por su propio pool de hilos.
+    
+    El parser encola trabajos (url, ruta destino) y sigue con el siguiente
+    producto mientras los workers descargan en segundo plano.
+    """
+    
+    def __init__(self, download_func, workers: int = 4, log=print):
+        self.download_func = download_func
+        self.log = log
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, url: str, filepath: Path, kind: str = 'variante', variant: str = None) -> Dict:
+        """Encola una descarga y devuelve el trabajo para consultar su resultado"""
+        job = {'url': url, 'path': filepath, 'kind': kind, 'variant': variant, 'ok': None, 'result': None,
+               'error': None, 'done': threading.Event()}
+        with self.lock:
+            self.submitted += 1
+        self.queue.put(job)
+        return job
+    
+    def _worker(self) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            
+            try:
+                job['result'] = self.download_func(job['url'], job['path'])
+                job['ok'] = job['result']['ok']
+            except Exception as e:
+                job['ok'] = False
+                job['error'] = str(e)
+            
+            with self.lock:
+                self.completed += 1
+                if not job['ok']:
+                    self.failed += 1
+                done, total = self.completed, self.submitted
+            self.log(f"⬇️  [{done}/{total}] {job['path']}")
+            job['done'].set()
+    
+    def close(self) -> None:
+        """Espera a que se vacíe la cola y detiene los workers"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+    
+    def cancel(self) -> None:
+        """Descarta los trabajos que siguen en cola y espera sólo los que están en curso"""
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job['ok'] = False
+                job['error'] = 'cancelado'
+                job['done'].set()
+        self.close()
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'submitted': self.submitted, 'completed': self.completed, 'failed': self.failed}
+
+class HttpCache:
+    """Caché HTTP en disco basada en validadores ETag/Last-Modified.
+    
+    Cada URL guarda un .json con sus validadores y, para páginas, un .body con
+    el contenido. En la siguiente ejecución se envían If-None-Match /
+    If-Modified-Since y un 304 se cuenta como acierto.
+    """
+    
+    def __init__(self, cache_dir: str = "scraper/.http_cache"):
+        self.cache_dir = Path(cache_dir)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = self.cache_dir / key[:2] / key
+        return base.with_suffix('.json'), base.with_suffix('.body')
+    
+    def load(self, url: str) -> Dict:
+        """Devuelve la entrada guardada para la URL o None"""
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def load_body(self, url: str) -> bytes:
+        _, body_path = self._paths(url)
+        try:
+            return body_path.read_bytes()
+        except OSError:
+            return None
+    
+    def conditional_headers(self, entry: Dict) -> Dict:
+        """Headers condicionales para revalidar una entrada"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def store(self, url: str, response: requests.Response, body: bytes = None) -> None:
+        """Guarda los validadores de la respuesta (y el cuerpo, si se pasa)"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        
+        meta_path, body_path = self._paths(url)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        if body is not None:
+            self._atomic_write(body_path, body)
+        entry = {'url': url, 'etag': etag, 'last_modified': last_modified, 'has_body': body is not None}
+        self._atomic_write(meta_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+    
+    def _atomic_write(self, path: Path, data: bytes) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+    
+    def record(self, hit: bool) -> None:
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+    
+    def merge_stats(self, stats: Dict) -> None:
+        with self.lock:
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+
+class CrawlJournal:
+    """Bitácora append-only (JSONL) con el avance del crawl.
+    
+    Registra cada listado de categoría, producto analizado e imagen descargada
+    en cuanto termina, para que `--resume` pueda saltarse ese trabajo si la
+    ejecución anterior se interrumpió.
+    """
+    
+    def __init__(self, path: str = "scraper/crawl_journal.jsonl", resume: bool = False):
+        self.path = Path(path)
+        self.resumed = resume
+        self.lock = threading.Lock()
+        self.categories = {}
+        self.products = {}
+        self.images = {}
+        
+        if resume:
+            self._load()
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Sin --resume se empieza una bitácora nueva
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+    
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    continue
+                
+                if record['type'] == 'category':
+                    self.categories[record['slug']] = record['products']
+                elif record['type'] == 'product':
+                    self.products[record['url']] = record['info']
+                elif record['type'] == 'image':
+                    self.images[record['path']] = record['url']
+        
+        print(f"📒 Bitácora cargada: {len(self.categories)} categorías, "
+              f"{len(self.products)} productos, {len(self.images)} imágenes")
+    
+    def _append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+    
+    def record_category(self, slug: str, products: List[Dict]) -> None:
+        self.categories[slug] = products
+        self._append({'type': 'category', 'slug': slug, 'products': products})
+    
+    def record_product(self, url: str, info: Dict) -> None:
+        self.products[url] = info
+        self._append({'type': 'product', 'url': url, 'info': info})
+    
+    def record_image(self, url: str, filepath: Path) -> None:
+        self.images[str(filepath)] = url
+        self._append({'type': 'image', 'url': url, 'path': str(filepath)})
+    
+    def has_image(self, url: str, filepath: Path) -> bool:
+        return self.images.get(str(filepath)) == url and filepath.exists()
+    
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+class ContentStore:
+    """Almacén de imágenes direccionado por contenido.
+    
+    Cada imagen se guarda una sola vez como `<sha256>.<ext>` y se enlaza
+    (hardlink, symlink o copia) en scraper/Categoria/Producto/variante.ext.
+    El índice URL normalizada -> blob se conserva entre ejecuciones.
+    """
+    
+    def __init__(self, store_dir: str = "scraper/.blobs"):
+        self.store_dir = Path(store_dir)
+        self.index_path = self.store_dir / 'index.json'
+        self.lock = threading.Lock()
+        self.new_blobs = 0
+        self.reused = 0
+        self.index = {}
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+    
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """Colapsa las variantes redimensionadas de WordPress a la imagen original"""
+        parsed = urllib.parse.urlparse(url)
+        return parsed._replace(path=WP_SIZE_SUFFIX.sub('', parsed.path), query='', fragment='').geturl()
+    
+    def blob_path(self, digest: str, ext: str) -> Path:
+        return self.store_dir / digest[:2] / f"{digest}{ext}"
+    
+    def lookup(self, key: str) -> Path:
+        """Blob ya descargado para la URL normalizada, o None"""
+        with self.lock:
+            name = self.index.get(key)
+        if name:
+            path = self.store_dir / name[:2] / name
+            if path.exists():
+                return path
+        return None
+    
+    def add(self, key: str, tmp_path: Path, digest: str, ext: str) -> Path:
+        """Mueve una descarga temporal al almacén (o la descarta si el contenido ya existía)"""
+        blob = self.blob_path(digest, ext)
+        with self.lock:
+            if blob.exists():
+                os.remove(tmp_path)
+                self.reused += 1
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, blob)
+                self.new_blobs += 1
+            self.index[key] = blob.name
+        return blob
+    
+    def link(self, blob: Path, filepath: Path) -> None:
+        """Expone un blob en la ruta de destino sin duplicar los bytes si se puede"""
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        if filepath.exists() or filepath.is_symlink():
+            filepath.unlink()
+        try:
+            os.link(blob, filepath)
+        except OSError:
+            try:
+                os.symlink(blob.resolve(), filepath)
+            except OSError:
+                shutil.copy2(blob, filepath)
+    
+    def record_reuse(self) -> None:
+        with self.lock:
+            self.reused += 1
+    
+    def save(self) -> None:
+        """Persiste el índice URL -> blob"""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.index, ensure_ascii=False, indent=0)
+        tmp_path = self.index_path.with_suffix('.part')
+        tmp_path.write_text(data, encoding='utf-8')
+        os.replace(tmp_path, self.index_path)
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'new_blobs': self.new_blobs, 'reused': self.reused, 'indexed_urls': len(self.index)}
+    
+    def merge(self, index: Dict, stats: Dict) -> None:
+        """Incorpora el índice y los contadores de otro proceso que usó el mismo directorio"""
+        with self.lock:
+            self.index.update(index)
+            self.new_blobs += stats['new_blobs']
+            self.reused += stats['reused']
+
+class Http2Response:
+    """Adapta una respuesta de httpx a la interfaz de requests que usa el scraper"""
+    
+    def __init__(self, response, stream: bool):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        if not stream:
+            response.read()
+    
+    @property
+    def content(self) -> bytes:
+        return self.response.read()
+    
+    def iter_content(self, chunk_size: int = 64 * 1024):
+        return self.response.iter_bytes(chunk_size)
+    
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+    
+    def close(self) -> None:
+        self.response.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Http2Session:
+    """Cliente alternativo sobre httpx con HTTP/2.
+    
+    Imita la parte de requests.Session que usa el scraper (headers y get) y
+    traduce los errores de transporte a las excepciones de requests para que
+    los reintentos funcionen igual con ambos backends.
+    """
+    
+    def __init__(self, max_connections: int = 10):
+        if httpx is None:
+            raise ImportError("--http2 requiere 'pip install httpx[http2]'")
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.client = httpx.Client(http2=True, limits=limits, follow_redirects=True)
+        self.headers = self.client.headers
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.http_versions = {}
+    
+    def get(self, url: str, headers: Dict = None, timeout=None, stream: bool = False) -> Http2Response:
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            request = self.client.build_request('GET', url, headers=headers, timeout=timeout)
+            response = self.client.send(request, stream=stream)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+        
+        with self.lock:
+            self.requests += 1
+            self.http_versions[response.http_version] = self.http_versions.get(response.http_version, 0) + 1
+        return Http2Response(response, stream)
+
+def render_derivatives(source: str, specs: List[Dict]) -> Dict:
+    """Genera los derivados de una imagen; corre en un proceso del pool de ImageProcessor.
+    
+    Lee el original una sola vez (para el sha256 y para Pillow) y escribe cada
+    derivado en un temporal que se renombra al terminar.
+    """
+    start = time.perf_counter()
+    source = Path(source)
+    data = source.read_bytes()
+    derivatives = {}
+    written = 0
+    
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        for spec in specs:
+            suffix = spec['suffix'] or source.suffix
+            target = source.with_name(f"{source.stem}{spec['tag']}{suffix}")
+            # Un original que ya es .webp sería su propio derivado WebP: no se recodifica encima
+            if target == source:
+                continue
+            
+            image = original
+            if spec['width'] and original.width > spec['width']:
+                height = max(1, round(original.height * spec['width'] / original.width))
+                image = original.resize((spec['width'], height), Image.LANCZOS)
+            
+            image_format = spec['format'] or original.format
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            
+            tmp_path = target.with_name(f".{target.name}.part")
+            image.save(tmp_path, format=image_format, quality=spec['quality'])
+            os.replace(tmp_path, target)
+            derivatives[spec['name']] = str(target)
+            written += target.stat().st_size
+    
+    return {'sha256': hashlib.sha256(data).hexdigest(), 'derivatives': derivatives,
+            'bytes': written, 'seconds': time.perf_counter() - start}
+
+class ImageProcessor:
+    """Derivados de las imágenes descargadas (WebP, miniaturas de ancho fijo).
+    
+    Cada imagen se encola en un pool de procesos en cuanto termina su
+    descarga, mientras siguen las demás. Un manifiesto con el sha256 de cada
+    original (scraper/.derivatives.json) evita regenerar los derivados de
+    imágenes que no cambiaron entre ejecuciones.
+    """
+    
+    def __init__(self, webp: bool = False, webp_quality: int = 80, thumbnails: List[int] = (),
+                 processes: int = None, manifest_path: str = "scraper/.derivatives.json", persist: bool = True,
+                 profiler: StageProfiler = None):
+        if Image is None:
+            raise ImportError("--webp/--thumbnails requieren 'pip install Pillow'")
+        
+        self.settings = {'webp': webp, 'webp_quality': webp_quality, 'thumbnails': list(thumbnails),
+                         'processes': processes, 'manifest_path': manifest_path}
+        self.specs = []
+        if webp:
+            self.specs.append({'name': 'webp', 'tag': '', 'suffix': '.webp', 'format': 'WEBP',
+                               'width': None, 'quality': webp_quality})
+        for width in thumbnails:
+            # Miniatura en WebP si se pidió WebP; si no, en el formato del original
+            self.specs.append({'name': f'{width}w', 'tag': f'-{width}w', 'suffix': '.webp' if webp else None,
+                               'format': 'WEBP' if webp else None, 'width': width, 'quality': webp_quality})
+        self.spec_names = [spec['name'] for spec in self.specs]
+        
+        self.manifest_path = Path(manifest_path)
+        self.persist = persist
+        # Tiempo y bytes de cada render, medidos en el proceso del pool
+        self.profiler = profiler
+        self.manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        # Entradas nuevas o regeneradas en esta ejecución
+        self.updates = {}
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    
+    def submit(self, source: Path, sha256: str = None) -> Future:
+        """Encola los derivados de `source`; el Future da {nombre: ruta}.
+        
+        `sha256` es el del original recién descargado, o None si la descarga
+        se saltó (archivo existente o 304): en ese caso alcanza con que el
+        manifiesto tenga la entrada y los archivos sigan en disco.
+        """
+        with self.lock:
+            entry = self.manifest.get(str(source))
+        if (entry and entry['specs'] == self.spec_names and sha256 in (None, entry['sha256'])
+                and all(os.path.exists(path) for path in entry['derivatives'].values())):
+            with self.lock:
+                self.skipped += 1
+            future = Future()
+            future.set_result(entry['derivatives'])
+            return future
+        
+        rendered = self.executor.submit(render_derivatives, str(source), self.specs)
+        future = Future()
+        rendered.add_done_callback(lambda done: self._finish(source, done, future))
+        return future
+    
+    def _finish(self, source: Path, rendered: Future, future: Future) -> None:
+        try:
+            result = rendered.result()
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            future.set_exception(e)
+            return
+        
+        entry = {'sha256': result['sha256'], 'specs': self.spec_names, 'derivatives': result['derivatives'],
+                 'seconds': result['seconds'], 'bytes': result['bytes']}
+        with self.lock:
+            self.manifest[str(source)] = entry
+            self.updates[str(source)] = entry
+            self.generated += 1
+        if self.profiler:
+            self.profiler.record('derivatives', result['seconds'], result['bytes'])
+        future.set_result(result['derivatives'])
+    
+    def merge(self, updates: Dict, stats: Dict) -> None:
+        """Incorpora el manifiesto y los contadores de un proceso de --processes"""
+        with self.lock:
+            self.manifest.update(updates)
+            self.updates.update(updates)
+            self.generated += stats['generated']
+            self.skipped += stats['skipped']
+            self.failed += stats['failed']
+    
+    def close(self) -> None:
+        """Espera los derivados pendientes y guarda el manifiesto"""
+        self.executor.shutdown(wait=True)
+        if not self.persist:
+            return
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.manifest, ensure_ascii=False, indent=0)
+        tmp_path = self.manifest_path.with_suffix('.part')
+        tmp_path.write_text(data, encoding='utf-8')
+        os.replace(tmp_path, self.manifest_path)
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'generated': self.generated, 'skipped': self.skipped, 'failed': self.failed}
+
+class ReportWriter:
+    """Escribe los reportes a medida que cada producto termina.
+    
+    Cada producto va como una línea de `productos.jsonl` y sus filas se
+    agregan al CSV, así la memoria no crece con el tamaño del catálogo.
+    `build_json_report` arma scraping_report.json al final leyendo el stream.
+    Con `csv_path=None` sólo se escribe el JSONL (los procesos de --processes).
+    """
+    
+    def __init__(self, row_builder, jsonl_path: str = "scraper/productos.jsonl",
+                 csv_path: str = "scraper/productos_scrapeados.csv"):
+        self.row_builder = row_builder
+        self.jsonl_path = Path(jsonl_path)
+        self.csv_path = Path(csv_path) if csv_path else None
+        self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+        self.products = 0
+        self.rows = 0
+        
+        self.jsonl_file = open(self.jsonl_path, 'w', encoding='utf-8')
+        self.csv_file = None
+        if self.csv_path:
+            self.csv_path.parent.mkdir(parents=True, exist_ok=True)
+            self.csv_file = open(self.csv_path, 'w', newline='', encoding='utf-8-sig')
+            self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=CSV_FIELDS)
+            self.csv_writer.writeheader()
+    
+    def write_product(self, category: Dict, product: Dict) -> None:
+        record = {'categoria': category['name'], 'categoria_slug': category['slug'], 'producto': product}
+        self.jsonl_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.products += 1
+        if self.csv_file:
+            rows = self.row_builder(category, product)
+            self.csv_writer.writerows(rows)
+            self.rows += len(rows)
+    
+    def close(self) -> None:
+        self.jsonl_file.close()
+        if self.csv_file:
+            self.csv_file.close()
+    
+    def records(self):
+        """Recorre (categoría, producto) desde productos.jsonl, de a una línea"""
+        return self.read_records(self.jsonl_path)
+    
+    @staticmethod
+    def read_records(jsonl_path: Path):
+        with open(jsonl_path, 'r', encoding='utf-8') as stream:
+            for line in stream:
+                record = json.loads(line)
+                yield {'name': record['categoria'], 'slug': record['categoria_slug']}, record['producto']
+    
+    def build_json_report(self, results: Dict, json_path: str = "scraper/scraping_report.json") -> None:
+        """Arma el reporte JSON agregado recorriendo el stream una sola vez.
+        
+        Los productos llegan en el orden de las categorías de `results`, así
+        que basta avanzar por esa lista; sólo una línea está en memoria a la vez.
+        """
+        categories = results['categories']
+        summary = {key: value for key, value in results.items() if key != 'categories'}
+        
+        with open(self.jsonl_path, 'r', encoding='utf-8') as stream, \
+                open(json_path, 'w', encoding='utf-8') as out:
+            out.write('{\n  "categories": [')
+            position = -1
+            first_product = True
+            
+            def open_category(index: int) -> None:
+                category = categories[index]
+                prefix = ',' if index else ''
+                out.write(f'{prefix}\n    {{"name": {json.dumps(category["name"], ensure_ascii=False)}, '
+                          f'"slug": {json.dumps(category["slug"], ensure_ascii=False)}, "products": [')
+            
+            for line in stream:
+                record = json.loads(line)
+                # Avanzar (cerrando categorías vacías) hasta la de este producto
+                while position < 0 or categories[position]['slug'] != record['categoria_slug']:
+                    if position >= 0:
+                        out.write(']}')
+                    position += 1
+                    open_category(position)
+                    first_product = True
+                
+                out.write(('' if first_product else ',') + '\n      ')
+                out.write(json.dumps(record['producto'], ensure_ascii=False))
+                first_product = False
+            
+            # Cerrar la última categoría con productos y las vacías restantes
+            if position >= 0:
+                out.write(']}')
+            for index in range(position + 1, len(categories)):
+                open_category(index)
+                out.write(']}')
+            
+            out.write('\n  ]')
+            for key, value in summary.items():
+                out.write(f',\n  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+            out.write('\n}\n')
+
+class ExtractionRules:
+    """Reglas declarativas para extraer imagen principal y variantes de un producto.
+    
+    Se cargan una sola vez desde un JSON (por defecto utilities/extraction_rules.json).
+    Los contenedores se describen por etiqueta y clase y se encuentran en una
+    sola pasada sobre el documento; dentro de ellos se usan selectores CSS
+    compilados con soupsieve. Un tema o plugin de swatches nuevo se soporta
+    agregando reglas, sin tocar el código.
+    """
+    
+    def __init__(self, path: str = DEFAULT_RULES):
+        self.path = Path(path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        # El parseo restringido sólo construye los subárboles con estas clases
+        self.strainer = SoupStrainer(attrs={'class': re.compile(
+            '(' + '|'.join(re.escape(name) for name in config['keep_classes']) + ')'
+        )})
+        
+        self.main_image = [self._compile_field(rule) for rule in config['main_image']]
+        self.swatches = [{
+            'container': self._compile_element(rule['container']),
+            'option': sv.compile(rule['option']),
+            'name': [self._compile_field(field) for field in rule['name']],
+            'image': self._compile_field(rule['image'])
+        } for rule in config['swatches']]
+        
+        fallback = config['fallback']
+        self.colors = fallback['colors']
+        # Con lookahead para encontrar también colores solapados ("negrojo")
+        self.color_pattern = re.compile('(?=(' + '|'.join(re.escape(color) for color in self.colors) + '))')
+        self.image_attrs = fallback['image_attrs']
+        self.include = re.compile(fallback['include'], re.IGNORECASE)
+        self.exclude = re.compile(fallback['exclude'], re.IGNORECASE)
+        self.extensions = re.compile(fallback['extensions'], re.IGNORECASE)
+        self.max_images = fallback['max_images']
+        
+        # Contenedores que se buscan en la única pasada sobre el documento
+        self.top_level = {'gallery': self._compile_element(config['gallery']),
+                          'variations_form': self._compile_element(config['variations_form']),
+                          'images': self._compile_element({'tags': ['img']})}
+        for index, rule in enumerate(self.main_image):
+            self.top_level[('main_image', index)] = rule['container']
+        for index, rule in enumerate(self.swatches):
+            self.top_level[('swatches', index)] = rule['container']
+        
+        # Índice etiqueta -> contenedores posibles, para descartar el resto de tags sin evaluarlos
+        self.by_tag = {}
+        for name, element in self.top_level.items():
+            for tag_name in element['tags']:
+                self.by_tag.setdefault(tag_name, []).append((name, element))
+    
+    @staticmethod
+    def _compile_element(spec: Dict) -> Dict:
+        """Compila un contenedor: etiquetas posibles y clase exacta o regex sobre cada clase"""
+        return {
+            'tags': spec['tags'],
+            'class': spec.get('class'),
+            'class_pattern': re.compile(spec['class_pattern']) if spec.get('class_pattern') else None
+        }
+    
+    @staticmethod
+    def _element_matches(element: Dict, tag) -> bool:
+        if not element['class'] and not element['class_pattern']:
+            return True
+        classes = tag.get('class') or []
+        if element['class'] and element['class'] not in classes:
+            return False
+        if element['class_pattern'] and not any(element['class_pattern'].search(name) for name in classes):
+            return False
+        return True
+    
+    @staticmethod
+    def _compile_field(rule: Dict) -> Dict:
+        """Compila una regla de valor: elemento (container/select), atributo y regex opcionales.
+        
+        `match` sólo filtra el valor; `pattern` extrae su primer grupo (o todo el match).
+        """
+        return {
+            'container': ExtractionRules._compile_element(rule['container']) if rule.get('container') else None,
+            'select': sv.compile(rule['select']) if rule.get('select') else None,
+            'attr': rule['attr'],
+            'match': re.compile(rule['match'], re.IGNORECASE) if rule.get('match') else None,
+            'pattern': re.compile(rule['pattern'], re.IGNORECASE) if rule.get('pattern') else None,
+            'slug': rule.get('slug', False)
+        }
+    
+    def scan(self, soup: BeautifulSoup) -> Dict:
+        """Recorre el documento una vez y agrupa los elementos por selector de primer nivel"""
+        matches = {name: [] for name in self.top_level}
+        by_tag = self.by_tag
+        for tag in soup.find_all(True):
+            for name, element in by_tag.get(tag.name, ()):
+                if self._element_matches(element, tag):
+                    matches[name].append(tag)
+        return matches
+    
+    def value(self, rule: Dict, tag) -> str:
+        """Valor de una regla sobre un elemento, o None si no aplica"""
+        if rule['select']:
+            tag = rule['select'].select_one(tag)
+            if not tag:
+                return None
+        value = tag.get(rule['attr'])
+        if not value:
+            return None
+        
+        if rule['match'] and not rule['match'].search(value):
+            return None
+        if rule['pattern']:
+            match = rule['pattern'].search(value)
+            if not match:
+                return None
+            value = match.group(1) if match.re.groups else match.group(0)
+        if rule['slug']:
+            value = value.replace('-', ' ').title()
+        return value
+    
+    def main_image_url(self, matches: Dict) -> str:
+        for index, rule in enumerate(self.main_image):
+            for tag in matches[('main_image', index)]:
+                url = self.value(rule, tag)
+                if url:
+                    return url
+        return None
+    
+    def swatch_variants(self, matches: Dict) -> Tuple[int, List[Tuple[str, str]]]:
+        """(swatches encontrados, [(variante, url)]) del primer plugin de swatches presente"""
+        for index, rule in enumerate(self.swatches):
+            containers = matches[('swatches', index)]
+            if not containers:
+                continue
+            
+            options = rule['option'].select(containers[0])
+            variants = []
+            for option in options:
+                name = next((value for value in (self.value(field, option) for field in rule['name']) if value), None)
+                image = self.value(rule['image'], option)
+                if name and image:
+                    variants.append((name.strip(), image))
+            return len(options), variants
+        return None, []
+    
+    def fallback_colors(self, soup: BeautifulSoup) -> List[str]:
+        """Colores conocidos que aparecen en el texto de la página, en el orden de la regla"""
+        found = set(self.color_pattern.findall(soup.get_text().lower()))
+        return [color.title() for color in self.colors if color in found]
+    
+    def fallback_images(self, matches: Dict) -> List[str]:
+        """Imágenes subidas al sitio (sin logos ni íconos), en orden de aparición"""
+        images = []
+        for img in matches['images']:
+            src = next((img.get(attr) for attr in self.image_attrs if img.get(attr)), None)
+            if src and self.include.search(src) and not self.exclude.search(src) and self.extensions.search(src):
+                images.append(src)
+        return images
+
+class CatalogExporter:
+    """Exporta el catálogo scrapeado como upserts en lote para Postgres/Supabase.
+    
+    Los productos se cargan primero en tablas temporales (INSERT multi-fila de
+    `batch_size` filas) y luego un INSERT ... SELECT ... ON CONFLICT por tabla
+    sincroniza categories, products y product_variants usando los slugs de
+    get_categories/get_products_from_category como llave. Las rutas locales
+    de cada imagen quedan en scraped_images (producto, variante) para el paso
+    de subida. El mismo SQL corre en SQLite, así que `write_sqlite` sirve de
+    destino local y para probar la exportación.
+    """
+    
+    def __init__(self, categories: List[Dict], records, batch_size: int = 500):
+        self.categories = categories
+        self.records = records
+        self.batch_size = max(1, batch_size)
+        self.counts = {'categories': 0, 'products': 0, 'variants': 0, 'images': 0, 'skipped': 0}
+    
+    @staticmethod
+    def literal(value) -> str:
+        if value is None:
+            return 'NULL'
+        if isinstance(value, bool):
+            return 'TRUE' if value else 'FALSE'
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return "'" + str(value).replace("'", "''") + "'"
+    
+    @staticmethod
+    def price(product_name: str) -> float:
+        match = PRICE_NUMBER.search(product_name)
+        return float(match.group(1).replace(',', '')) if match else None
+    
+    @staticmethod
+    def variant_value(variant_name: str) -> str:
+        """'Café Oscuro' -> 'café-oscuro', como el variant_value de product_variants"""
+        return re.sub(r'[\s/]+', '-', variant_name.strip().lower())
+    
+    def _insert(self, table: str, columns: List[str], rows: List[Tuple], suffix: str = '') -> str:
+        values = ',\n'.join('(' + ', '.join(self.literal(value) for value in row) + ')' for row in rows)
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n{values}{suffix};"
+    
+    def statements(self):
+        """Sentencias SQL en orden; los lotes se arman a medida que se leen los productos"""
+        yield 'BEGIN;'
+        # ON CONFLICT (slug) necesita un índice único sobre el slug
+        yield 'CREATE UNIQUE INDEX IF NOT EXISTS categories_slug_key ON categories (slug);'
+        yield 'CREATE UNIQUE INDEX IF NOT EXISTS products_slug_key ON products (slug);'
+        yield ('CREATE TABLE IF NOT EXISTS scraped_images (product_slug TEXT NOT NULL, variant TEXT NOT NULL, '
+               'kind TEXT, source_url TEXT, local_path TEXT, status TEXT, bytes INTEGER, sha256 TEXT, '
+               'derivatives TEXT, updated_at TIMESTAMP, PRIMARY KEY (product_slug, variant));')
+        yield 'CREATE TEMP TABLE scraper_categories (slug TEXT PRIMARY KEY, name TEXT NOT NULL);'
+        yield ('CREATE TEMP TABLE scraper_products (slug TEXT PRIMARY KEY, category_slug TEXT, name TEXT NOT NULL, '
+               'price NUMERIC, permalink TEXT, main_image_url TEXT, has_variants BOOLEAN);')
+        yield ('CREATE TEMP TABLE scraper_variants (product_slug TEXT NOT NULL, sort_order INTEGER NOT NULL, '
+               'variant_name TEXT NOT NULL, variant_value TEXT NOT NULL, image_url TEXT, '
+               'PRIMARY KEY (product_slug, sort_order));')
+        
+        categories = []
+        for category in self.categories:
+            if category['slug'] not in {slug for slug, _ in categories}:
+                categories.append((category['slug'], category['name']))
+        for start in range(0, len(categories), self.batch_size):
+            yield self._insert('scraper_categories', ['slug', 'name'], categories[start:start + self.batch_size])
+        self.counts['categories'] = len(categories)
+        
+        products, variants, images = [], [], []
+        seen = set()
+        image_columns = ['product_slug', 'variant', 'kind', 'source_url', 'local_path', 'status', 'bytes',
+                         'sha256', 'derivatives', 'updated_at']
+        image_upsert = ('\nON CONFLICT (product_slug, variant) DO UPDATE SET kind = EXCLUDED.kind, '
+                        'source_url = EXCLUDED.source_url, local_path = EXCLUDED.local_path, status = EXCLUDED.status, '
+                        'bytes = EXCLUDED.bytes, sha256 = EXCLUDED.sha256, derivatives = EXCLUDED.derivatives, '
+                        'updated_at = EXCLUDED.updated_at')
+        
+        for category, product in self.records:
+            # Un producto listado en dos categorías se exporta con la primera
+            if product['slug'] in seen:
+                continue
+            # Página que no se pudo obtener (o sin variantes en reportes viejos): exportarla
+            # borraría la imagen principal y desactivaría sus variantes en el catálogo
+            if product.get('fetch_failed') or not product['variants']:
+                self.counts['skipped'] += 1
+                continue
+            seen.add(product['slug'])
+            
+            names = [name for name in product['variants'] if name != 'default']
+            # El listado trae el precio en el nombre ("Bolsa MXN $480.00"); al catálogo va limpio
+            products.append((product['slug'], category['slug'], ArtesanaScraper.clean_product_name(product['name']),
+                             self.price(product['name']), product.get('url'), product.get('main_image'), bool(names)))
+            for sort_order, variant_name in enumerate(names):
+                variant_images = product['variants'][variant_name]
+                variants.append((product['slug'], sort_order, variant_name, self.variant_value(variant_name),
+                                 variant_images[0] if variant_images else None))
+            
+            downloads = [('', 'principal', product.get('main_image_download'))]
+            downloads += [(name, 'variante', download) for name, download in product.get('variant_downloads', {}).items()]
+            for variant, kind, download in downloads:
+                if download and download['status'] != 'failed':
+                    images.append((product['slug'], variant, kind, download['url'], download['path'],
+                                   download['status'], download['bytes'], download['sha256'],
+                                   json.dumps(download.get('derivatives', {}), ensure_ascii=False),
+                                   time.strftime('%Y-%m-%d %H:%M:%S')))
+            
+            if len(products) >= self.batch_size:
+                yield self._insert('scraper_products', ['slug', 'category_slug', 'name', 'price', 'permalink',
+                                                        'main_image_url', 'has_variants'], products)
+                self.counts['products'] += len(products)
+                products = []
+            if len(variants) >= self.batch_size:
+                yield self._insert('scraper_variants', ['product_slug', 'sort_order', 'variant_name',
+                                                        'variant_value', 'image_url'], variants)
+                self.counts['variants'] += len(variants)
+                variants = []
+            if len(images) >= self.batch_size:
+                yield self._insert('scraped_images', image_columns, images, image_upsert)
+                self.counts['images'] += len(images)
+                images = []
+        
+        if products:
+            yield self._insert('scraper_products', ['slug', 'category_slug', 'name', 'price', 'permalink',
+                                                    'main_image_url', 'has_variants'], products)
+            self.counts['products'] += len(products)
+        if variants:
+            yield self._insert('scraper_variants', ['product_slug', 'sort_order', 'variant_name',
+                                                    'variant_value', 'image_url'], variants)
+            self.counts['variants'] += len(variants)
+        if images:
+            yield self._insert('scraped_images', image_columns, images, image_upsert)
+            self.counts['images'] += len(images)
+        
+        # Sincronización por conjuntos; el WHERE TRUE evita la ambigüedad de
+        # INSERT ... SELECT ... ON CONFLICT en SQLite y en Postgres no cambia nada
+        yield ('INSERT INTO categories (name, slug, is_active)\n'
+               'SELECT name, slug, TRUE FROM scraper_categories WHERE TRUE\n'
+               'ON CONFLICT (slug) DO UPDATE SET name = EXCLUDED.name;')
+        yield ('INSERT INTO products (name, slug, price, permalink, main_image_url, has_variants, category_id, updated_at)\n'
+               'SELECT p.name, p.slug, COALESCE(p.price, 0), p.permalink, p.main_image_url, p.has_variants, c.id, '
+               'CURRENT_TIMESTAMP\n'
+               'FROM scraper_products p LEFT JOIN categories c ON c.slug = p.category_slug WHERE TRUE\n'
+               'ON CONFLICT (slug) DO UPDATE SET name = EXCLUDED.name, '
+               'price = CASE WHEN EXCLUDED.price > 0 THEN EXCLUDED.price ELSE products.price END, '
+               'permalink = EXCLUDED.permalink, main_image_url = EXCLUDED.main_image_url, '
+               'has_variants = EXCLUDED.has_variants, category_id = EXCLUDED.category_id, '
+               'updated_at = EXCLUDED.updated_at;')
+        # Misma convención de id que la migración existente: "<product_id>-<orden>"
+        yield ('INSERT INTO product_variants (id, product_id, variant_name, variant_value, variant_type, image_url, '
+               'sort_order, is_active, updated_at)\n'
+               "SELECT pr.id || '-' || v.sort_order, pr.id, v.variant_name, v.variant_value, 'color', v.image_url, "
+               'v.sort_order, TRUE, CURRENT_TIMESTAMP\n'
+               'FROM scraper_variants v JOIN products pr ON pr.slug = v.product_slug WHERE TRUE\n'
+               'ON CONFLICT (id) DO UPDATE SET variant_name = EXCLUDED.variant_name, '
+               'variant_value = EXCLUDED.variant_value, image_url = EXCLUDED.image_url, '
+               'sort_order = EXCLUDED.sort_order, is_active = TRUE, updated_at = EXCLUDED.updated_at;')
+        # Variantes que ya no están en el sitio: se desactivan, no se borran (cart_items las referencia).
+        # Sólo se tocan productos de scraper_products, es decir, con la página leída bien
+        yield ('UPDATE product_variants SET is_active = FALSE\n'
+               'WHERE product_id IN (SELECT pr.id FROM products pr JOIN scraper_products p ON p.slug = pr.slug)\n'
+               "AND id NOT IN (SELECT pr.id || '-' || v.sort_order FROM scraper_variants v "
+               'JOIN products pr ON pr.slug = v.product_slug);')
+        yield 'DROP TABLE scraper_variants;'
+        yield 'DROP TABLE scraper_products;'
+        yield 'DROP TABLE scraper_categories;'
+        yield 'COMMIT;'
+    
+    def write_sql(self, path: str) -> None:
+        """Archivo .sql para psql o el editor SQL de Supabase (una sola transacción)"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('-- Catálogo exportado por artesana_scraper.py\n')
+            for statement in self.statements():
+                f.write(statement + '\n')
+    
+    def write_sqlite(self, path: str) -> None:
+        """Carga el catálogo en una base SQLite local (crea las tablas si no existen)"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: la transacción la abren y cierran las propias sentencias
+        connection = sqlite3.connect(path, isolation_level=None)
+        try:
+            connection.executescript(SQLITE_CATALOG_SCHEMA)
+            for statement in self.statements():
+                connection.execute(statement)
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK;')
+            raise
+        finally:
+            connection.close()
 
 class ArtesanaScraper:
-    def __init__(self, base_url: str = "http://estudioartesana.local", delay: float = 1.0):
+    def __init__(self, base_url: str = "http://estudioartesana.local", delay: float = 1.0,
+                 workers: int = 1, rate: float = None, download_workers: int = 4,
+                 cache_dir: str = "scraper/.http_cache", journal: 'CrawlJournal' = None,
+                 parser: str = 'lxml', use_sitemap: bool = True, engine: str = 'html',
+                 content_store: ContentStore = None, retries: int = 3, backoff: float = 1.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0, http2: bool = False,
+                 quiet: bool = False, rules: ExtractionRules = None, processes: int = 1,
+                 image_processor: ImageProcessor = None):
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.delay = delay
+        self.workers = max(1, workers)
+        self.download_workers = max(1, download_workers)
+        # (connect, read) en segundos, aplicado a todos los requests
+        self.timeout = (connect_timeout, read_timeout)
+        
+        # Un pool con una conexión por hilo que pueda estar haciendo requests
+        pool_size = self.workers + self.download_workers
+        if http2:
+            self.session = Http2Session(max_connections=pool_size)
+        else:
+            self.session = requests.Session()
+            # Los reintentos los maneja _request, no urllib3
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Connection': 'keep-alive'
         })
-        self.delay = delay
+        # Presupuesto de cortesía por host; por defecto equivale a un request cada `delay` segundos
+        if rate is None:
+            rate = 1.0 / delay if delay > 0 else 0.0
+        self.rate_limiter = RateLimiter(rate)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        # Requests que fallaron y luego salieron bien, y páginas perdidas del todo
+        self.recovered = []
+        self.page_errors = []
+        # Caché condicional; cache_dir=None la desactiva
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.journal = journal
+        # Backend de BeautifulSoup: 'lxml' (rápido) o 'html.parser' (sin dependencias)
+        self.parser = parser
+        # Selectores y regex de la página de producto, compilados una sola vez
+        self.rules = rules or ExtractionRules()
+        self.use_sitemap = use_sitemap
+        # slug de producto -> {'url', 'lastmod'} según el sitemap
+        self.sitemap_products = {}
+        # Motor de extracción de variantes: 'html' (swatches cfvsw),
+        # 'variations' (JSON data-product_variations) o 'store-api'
+        self.engine = engine
+        # slug de producto -> datos precargados desde la Store API
+        self.store_api_products = {}
+        self.content_store = content_store
+        self.quiet = quiet
+        # Procesos para la fase 2 (--processes); cada uno con su sesión y tasa
+        self.processes = max(1, processes)
+        self.shard_connections = []
+        self.profiler = StageProfiler()
+        # Derivados (WebP, miniaturas) de cada imagen descargada; None los desactiva
+        self.image_processor = image_processor
+        if image_processor and image_processor.profiler is None:
+            image_processor.profiler = self.profiler
         self.downloaded_images = set()
+        self.lock = threading.Lock()
+    
+    def log(self, message: str) -> None:
+        """Mensajes de avance por elemento; --quiet los suprime"""
+        if not self.quiet:
+            print(message)
+    
+    def _request(self, url: str, **kwargs) -> requests.Response:
+        """Hace un GET respetando el límite por host, con reintentos y backoff exponencial.
         
-    def get_page(self, url: str) -> BeautifulSoup:
-        """Obtiene y parsea una página"""
+        Se reintentan timeouts, errores de conexión y respuestas 429/502/503/504;
+        la última respuesta (o excepción) se devuelve tal cual al llamador.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            with self.profiler.wait('rate_limit_wait'):
+                self.rate_limiter.wait(url)
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.rate_limiter.feedback(url)
+                if attempt == self.retries:
+                    raise
+                pause = self._backoff_delay(attempt)
+                self.log(f"🔁 {url}: {e.__class__.__name__}, reintento {attempt + 1} en {pause:.1f}s")
+                with self.profiler.wait('retry_backoff'):
+                    time.sleep(pause)
+                continue
+            
+            retry_after = self._retry_after(response)
+            self.rate_limiter.feedback(url, time.monotonic() - start, response.status_code, retry_after)
+            
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                response.close()
+                pause = max(self._backoff_delay(attempt), retry_after or 0)
+                self.log(f"🔁 {url}: HTTP {response.status_code}, reintento {attempt + 1} en {pause:.1f}s")
+                with self.profiler.wait('retry_backoff'):
+                    time.sleep(pause)
+                continue
+            
+            if attempt and response.status_code not in RETRY_STATUS:
+                with self.lock:
+                    self.recovered.append(f"{url} (tras {attempt} reintentos)")
+            return response
+    
+    def connection_stats(self) -> Dict:
+        """Conexiones abiertas contra requests hechos, para medir la reutilización keep-alive"""
+        if isinstance(self.session, Http2Session):
+            with self.session.lock:
+                stats = {'requests': self.session.requests, 'protocols': dict(self.session.http_versions)}
+            # Más las sesiones de los procesos de --processes
+            for shard in self.shard_connections:
+                stats['requests'] += shard['requests']
+                for name, count in shard['protocols'].items():
+                    stats['protocols'][name] = stats['protocols'].get(name, 0) + count
+            return stats
+        
+        connections = sum(shard['connections'] for shard in self.shard_connections)
+        request_count = sum(shard['requests'] for shard in self.shard_connections)
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections += pool.num_connections
+                request_count += pool.num_requests
+        return {'requests': request_count, 'connections': connections,
+                'reused': max(0, request_count - connections)}
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """Espera exponencial con jitter: backoff * 2^intento * [0.5, 1.5)"""
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+    
+    def _retry_after(self, response: requests.Response) -> float:
+        """Segundos pedidos en el header Retry-After (número o fecha HTTP)"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
         try:
-            response = self.session.get(url)
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+        
+    def _fetch_page(self, url: str) -> bytes:
+        """Descarga el HTML de una página, revalidando contra la caché si existe"""
+        if not self.cache:
+            response = self._request(url)
             response.raise_for_status()
-            time.sleep(self.delay)
-            return BeautifulSoup(response.content, 'html.parser')
+            return response.content
+        
+        entry = self.cache.load(url)
+        response = self._request(url, headers=self.cache.conditional_headers(entry))
+        if response.status_code == 304:
+            body = self.cache.load_body(url) if entry and entry.get('has_body') else None
+            if body is not None:
+                self.cache.record(hit=True)
+                return body
+            # El cuerpo se perdió: pedir la página completa
+            response = self._request(url)
+        
+        response.raise_for_status()
+        self.cache.record(hit=False)
+        self.cache.store(url, response, body=response.content)
+        return response.content
+        
+    def parse_html(self, content: bytes, parse_only: SoupStrainer = None) -> BeautifulSoup:
+        """Parsea HTML con el backend configurado, opcionalmente sólo los subárboles de `parse_only`"""
+        with self.profiler.stage('parse_html'):
+            return BeautifulSoup(content, self.parser, parse_only=parse_only)
+    
+    def get_page(self, url: str, parse_only: SoupStrainer = None) -> BeautifulSoup:
+        """Obtiene y parsea una página"""
+        content = self.get_page_content(url)
+        if content is None:
+            return None
+        return self.parse_html(content, parse_only)
+    
+    def get_page_content(self, url: str) -> bytes:
+        """Obtiene el HTML de una página sin parsear, o None si falló"""
+        try:
+            with self.profiler.stage('fetch_page') as metrics:
+                content = self._fetch_page(url)
+                metrics['bytes'] = len(content)
+            return content
         except Exception as e:
             print(f"Error obteniendo {url}: {e}")
+            with self.lock:
+                self.page_errors.append(f"Error obteniendo {url}: {e}")
             return None
     
     def get_categories(self) -> List[Dict]:
@@ -42,14 +1436,16 @@ class ArtesanaScraper:
         print("🔍 Buscando categorías de productos...")
         
         categories = []
+        sitemap_categories = self.discover_from_sitemap() if self.use_sitemap else []
+        
         shop_url = f"{self.base_url}/tienda"
-        soup = self.get_page(shop_url)
+        soup = self.get_page(shop_url, parse_only=CATEGORY_LINKS)
         
-        if not soup:
+        if not soup and not sitemap_categories:
             return categories
             
         # Buscar enlaces de categorías
-        category_links = soup.find_all('a', href=re.compile(r'/product-category/'))
+        category_links = soup.find_all('a', href=re.compile(r'/product-category/')) if soup else []
         
         for link in category_links:
             href = link.get('href')
@@ -70,6 +1466,9 @@ class ArtesanaScraper:
                     'url': full_url
                 })
         
+        # Categorías del sitemap que no están enlazadas desde /tienda
+        categories.extend(sitemap_categories)
+        
         # Eliminar duplicados
         seen = set()
         unique_categories = []
@@ -83,16 +1482,28 @@ class ArtesanaScraper:
     
     def get_products_from_category(self, category: Dict) -> List[Dict]:
         """Obtiene productos de una categoría"""
-        print(f"📦 Buscando productos en '{category['name']}'...")
+        self.log(f"📦 Buscando productos en '{category['name']}'...")
         
         products = []
-        soup = self.get_page(category['url'])
+        soup = self.get_page(category['url'], parse_only=PRODUCT_LINKS)
         
         if not soup:
             return products
         
-        # Buscar enlaces de productos
-        product_links = soup.find_all('a', href=re.compile(r'/product/'))
+        # Seguir la paginación /page/N/ hasta la última página enlazada
+        product_links = []
+        page = 1
+        while soup:
+            product_links.extend(soup.find_all('a', href=re.compile(r'/product/')))
+            
+            last_page = page
+            for link in soup.find_all('a', href=PAGE_NUMBER):
+                last_page = max(last_page, int(PAGE_NUMBER.search(link['href']).group(1)))
+            if last_page <= page:
+                break
+            
+            page += 1
+            soup = self.get_page(f"{category['url'].rstrip('/')}/page/{page}/", parse_only=PRODUCT_LINKS)
         
         for link in product_links:
             href = link.get('href')
@@ -124,138 +1535,321 @@ class ArtesanaScraper:
                 seen.add(prod['slug'])
                 unique_products.append(prod)
         
-        print(f"✅ Encontrados {len(unique_products)} productos en '{category['name']}'")
+        if page > 1:
+            self.log(f"📄 '{category['name']}': {page} páginas de listado")
+        self.log(f"✅ Encontrados {len(unique_products)} productos en '{category['name']}'")
         return unique_products
     
-    def get_product_variants_and_images(self, product: Dict) -> Dict:
-        """Obtiene variantes e imágenes específicas de un producto"""
-        print(f"🎨 Analizando producto '{product['name']}'...")
+    def discover_from_sitemap(self) -> List[Dict]:
+        """Descubre categorías y productos desde los sitemaps XML del sitio.
         
-        soup = self.get_page(product['url'])
-        if not soup:
-            return {'variants': {}, 'main_image': None}
+        Devuelve las categorías encontradas y llena `self.sitemap_products`
+        con la URL y el `lastmod` de cada producto. Si el sitio no publica
+        sitemaps devuelve una lista vacía.
+        """
+        for path in SITEMAP_PATHS:
+            entries = self._read_sitemap(self.base_url + path)
+            if entries is not None:
+                break
+        else:
+            print("⚠️  No se encontró sitemap, se usará sólo /tienda")
+            return []
+        
+        categories = []
+        for loc, lastmod in entries:
+            if '/product-category/' in loc:
+                slug = loc.split('/product-category/')[-1].strip('/')
+                categories.append({'name': slug.split('/')[-1].replace('-', ' ').title(), 'slug': slug, 'url': loc})
+            elif '/product/' in loc:
+                slug = loc.split('/product/')[-1].strip('/')
+                self.sitemap_products[slug] = {'url': loc, 'lastmod': lastmod}
+        
+        print(f"🗺️  Sitemap: {len(categories)} categorías, {len(self.sitemap_products)} productos")
+        return categories
+    
+    def _read_sitemap(self, url: str) -> List[Tuple[str, str]]:
+        """Lee un sitemap (o índice de sitemaps) de forma incremental.
+        
+        Devuelve pares (loc, lastmod); de un índice sólo se siguen los
+        sitemaps de productos y categorías de producto.
+        """
+        try:
+            response = self._request(url, stream=True)
+            if response.status_code != 200:
+                response.close()
+                return None
+            
+            entries = []
+            children = []
+            parser = ET.XMLPullParser(events=('end',))
+            with response:
+                # iter_content ya descomprime gzip/br y funciona con ambos backends
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    parser.feed(chunk)
+                    for _, element in parser.read_events():
+                        if element.tag == f'{SITEMAP_NS}url':
+                            entries.append((element.findtext(f'{SITEMAP_NS}loc', '').strip(),
+                                            element.findtext(f'{SITEMAP_NS}lastmod')))
+                            element.clear()
+                        elif element.tag == f'{SITEMAP_NS}sitemap':
+                            loc = element.findtext(f'{SITEMAP_NS}loc', '').strip()
+                            if 'product' in loc:
+                                children.append(loc)
+                            element.clear()
+            parser.close()
+            
+            for child in children:
+                entries.extend(self._read_sitemap(child) or [])
+            return entries
+        except Exception as e:
+            print(f"⚠️  Error leyendo sitemap {url}: {e}")
+            return None
+    
+    def page_fingerprint(self, soup: BeautifulSoup, matches: Dict = None) -> str:
+        """Huella del HTML relevante del producto (swatches y galería).
+        
+        Ignora el resto de la página (nonces, menús, carrito) para que sólo
+        cambie cuando cambian las variantes o las imágenes.
+        """
+        if matches is None:
+            matches = self.rules.scan(soup)
+        
+        parts = []
+        for index in range(len(self.rules.swatches)):
+            parts.extend(str(container) for container in matches[('swatches', index)][:1])
+        
+        for form in matches['variations_form'][:1]:
+            if form.get('data-product_variations'):
+                parts.append(form['data-product_variations'])
+        
+        parts.extend(str(container) for container in matches['gallery'])
+        
+        # Sin swatches ni galería, usar la lista de imágenes de la página
+        if not parts:
+            parts = [img.get('src') or img.get('data-src') or '' for img in matches['images']]
+        
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+    
+    def get_product_variants_and_images(self, product: Dict, previous: Dict = None) -> Dict:
+        """Obtiene variantes e imágenes específicas de un producto.
+        
+        Si se pasa `previous` (la entrada del reporte anterior) y la huella de
+        la página no cambió, se reutilizan sus variantes sin volver a extraerlas.
+        """
+        self.log(f"🎨 Analizando producto '{product['name']}'...")
+        
+        if product['slug'] in self.store_api_products:
+            return self._product_from_store_api(product, previous)
+        
+        content = self.get_page_content(product['url'])
+        if content is None:
+            return {'variants': {}, 'main_image': None, 'fetch_failed': True}
+        
+        soup = self.parse_html(content, self.rules.strainer)
+        return self.extract_product_data(soup, product, previous, content)
+    
+    def extract_product_data(self, soup: BeautifulSoup, product: Dict, previous: Dict = None,
+                             content: bytes = None) -> Dict:
+        """Extrae variantes e imagen principal de una página de producto ya parseada.
+        
+        Con `content` (el HTML original) el método alternativo busca colores e
+        imágenes en el documento completo y no sólo en lo que dejó el strainer.
+        """
+        with self.profiler.stage('extract'):
+            return self._extract_product_data(soup, product, previous, content)
+    
+    def _extract_product_data(self, soup: BeautifulSoup, product: Dict, previous: Dict = None,
+                              content: bytes = None) -> Dict:
+        # Una sola pasada sobre el documento; el resto trabaja sobre estos grupos
+        matches = self.rules.scan(soup)
+        
+        fingerprint = self.page_fingerprint(soup, matches)
+        if previous and previous.get('fingerprint') == fingerprint:
+            self.log(f"⏭️  Sin cambios desde el reporte anterior: '{product['name']}'")
+            return {
+                'variants': previous['variants'],
+                'main_image': previous.get('main_image'),
+                'fingerprint': fingerprint,
+                'unchanged': True
+            }
         
         product_data = {
             'variants': {},  # Cambiar a dict para mapear variante -> imagen específica
-            'main_image': None  # Imagen principal del producto
+            'main_image': None,  # Imagen principal del producto
+            'fingerprint': fingerprint
         }
         
-        # Buscar imagen principal del producto
-        main_img = None
-        # Buscar imagen con clase zoomImg (imagen principal)
-        zoom_img = soup.find('img', class_='zoomImg')
-        if zoom_img and zoom_img.get('src'):
-            main_img = zoom_img.get('src')
-        
-        # Si no encuentra zoomImg, buscar otras imágenes principales comunes
-        if not main_img:
-            # Buscar en contenedores típicos de imagen principal
-            main_containers = soup.find_all(['div', 'figure'], class_=re.compile(r'(product-image|main-image|featured-image|woocommerce-product-gallery)'))
-            for container in main_containers:
-                img = container.find('img')
-                if img and img.get('src'):
-                    src = img.get('src')
-                    if any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
-                        main_img = src
-                        break
-        
+        # Imagen principal: zoomImg y luego los contenedores típicos de galería
+        main_img = self.rules.main_image_url(matches)
         if main_img:
             # Convertir URL relativa a absoluta si es necesario
             if not main_img.startswith('http'):
                 main_img = self.base_url + main_img
             product_data['main_image'] = main_img
-            print(f"  📸 Imagen principal encontrada: {main_img}")
-        
-        # Buscar contenedor específico de swatches cfvsw
-        swatch_container = soup.find('div', class_='cfvsw-swatches-container')
+            self.log(f"  📸 Imagen principal encontrada: {main_img}")
         
         variants_found = False
-        if swatch_container:
-            # Buscar swatches individuales con clase cfvsw-swatches-option
-            swatches = swatch_container.find_all('div', class_='cfvsw-swatches-option')
-            print(f"  🔍 Encontrados {len(swatches)} swatches cfvsw")
-            
-            for swatch in swatches:
-                variant_name = None
-                variant_image = None
-                
-                # Obtener nombre de la variante desde atributos data-*
-                if swatch.get('data-title'):
-                    variant_name = swatch.get('data-title')
-                elif swatch.get('data-slug'):
-                    variant_name = swatch.get('data-slug').replace('-', ' ').title()
-                elif swatch.get('data-tooltip'):
-                    variant_name = swatch.get('data-tooltip')
-                
-                # Buscar imagen específica en el div interno cfvsw-swatch-inner
-                inner_div = swatch.find('div', class_='cfvsw-swatch-inner')
-                if inner_div and inner_div.get('style'):
-                    style = inner_div.get('style')
-                    # Buscar background-image en el style
-                    url_match = re.search(r"background-image:url\(['\"]?([^'\"\)]+)['\"]?\)", style)
-                    if url_match:
-                        variant_image = url_match.group(1)
+        if self.engine == 'variations' and matches['variations_form']:
+            variants_found = self._extract_variations_json(matches['variations_form'][0], product_data)
+        
+        # Swatches del primer plugin presente (cfvsw por defecto)
+        if not variants_found:
+            swatch_count, swatch_variants = self.rules.swatch_variants(matches)
+            if swatch_count is None:
+                self.log("  ⚠️ No se encontró contenedor de swatches")
+            else:
+                self.log(f"  🔍 Encontrados {swatch_count} swatches")
+            
+            for variant_name, variant_image in swatch_variants:
+                # Convertir URL relativa a absoluta si es necesario
+                if not variant_image.startswith('http'):
+                    variant_image = self.base_url + variant_image
                 
-                if variant_name and variant_image:
-                    # Convertir URL relativa a absoluta si es necesario
-                    if not variant_image.startswith('http'):
-                        variant_image = self.base_url + variant_image
-                    
-                    product_data['variants'][variant_name.strip()] = [variant_image]
-                    variants_found = True
-                    print(f"  🎨 {variant_name}: {variant_image}")
-        else:
-            print("  ⚠️ No se encontró contenedor cfvsw-swatches-container")
+                product_data['variants'][variant_name] = [variant_image]
+                variants_found = True
+                self.log(f"  🎨 {variant_name}: {variant_image}")
         
         # Si no encontramos swatches con imágenes específicas, usar método fallback
         if not variants_found:
-            print("  ⚠️ No se encontraron swatches con imágenes específicas, usando método alternativo...")
-            
-            # Buscar variantes por nombres de colores
-            variant_names = []
-            text_content = soup.get_text().lower()
-            color_patterns = [
-                'beige', 'café', 'chocolate', 'negro', 'blanco', 'rojo', 'azul', 'verde',
-                'amarillo', 'rosa', 'morado', 'gris', 'marrón', 'naranja', 'crema'
-            ]
+            self.log("  ⚠️ No se encontraron swatches con imágenes específicas, usando método alternativo...")
             
-            for color in color_patterns:
-                if color in text_content:
-                    variant_names.append(color.title())
+            # El parseo restringido sólo conserva los contenedores de las reglas; el texto
+            # (pestaña de descripción) y las <img> sueltas están en el resto del documento
+            if content is not None:
+                soup = self.parse_html(content)
+                matches = self.rules.scan(soup)
             
-            # Si no hay variantes por color, usar default
-            if not variant_names:
-                variant_names = ['default']
+            # Buscar variantes por nombres de colores; si no hay, usar default
+            variant_names = self.rules.fallback_colors(soup) or ['default']
             
-            # Buscar imágenes principales del producto
+            # Imágenes subidas al sitio que aparecen en la página
             main_images = []
-            
-            # Buscar en galería principal
-            gallery_images = soup.find_all('img')
-            for img in gallery_images:
-                src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-                if src:
-                    # Filtrar imágenes relevantes
-                    if any(keyword in src.lower() for keyword in ['upload', 'wp-content/uploads']):
-                        if not any(skip in src.lower() for skip in ['logo', 'icon', 'banner', 'header', 'flag']):
-                            if any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
-                                full_img_url = src if src.startswith('http') else self.base_url + src
-                                if full_img_url not in main_images:
-                                    main_images.append(full_img_url)
+            for src in self.rules.fallback_images(matches):
+                full_img_url = src if src.startswith('http') else self.base_url + src
+                if full_img_url not in main_images:
+                    main_images.append(full_img_url)
             
             # Asignar imágenes a variantes
             for variant_name in variant_names:
-                product_data['variants'][variant_name] = main_images[:3]  # Máximo 3 imágenes por variante
+                product_data['variants'][variant_name] = main_images[:self.rules.max_images]
         
         # Si aún no hay variantes, crear una por defecto
         if not product_data['variants']:
             product_data['variants'] = {'default': []}
         
         total_images = sum(len(images) for images in product_data['variants'].values())
-        print(f"✅ Producto '{product['name']}': {len(product_data['variants'])} variantes, {total_images} imágenes totales")
+        self.log(f"✅ Producto '{product['name']}': {len(product_data['variants'])} variantes, {total_images} imágenes totales")
         return product_data
     
-    def clean_product_name(self, product_name: str) -> str:
+    def _extract_variations_json(self, form, product_data: Dict) -> bool:
+        """Variantes desde el JSON `data-product_variations` del formulario de WooCommerce.
+        
+        WooCommerce pone `false` cuando el producto tiene demasiadas variaciones
+        y las carga por AJAX; en ese caso devuelve False para usar los swatches.
+        """
+        raw = form.get('data-product_variations')
+        if not raw or raw == 'false':
+            return False
+        
+        try:
+            variations = json.loads(raw)
+        except ValueError:
+            return False
+        
+        # Nombres visibles de cada opción (slug -> texto del <option>)
+        labels = {}
+        for select in form.find_all('select'):
+            for option in select.find_all('option'):
+                if option.get('value'):
+                    labels[(select.get('name'), option['value'])] = option.get_text(strip=True)
+        
+        found = False
+        for variation in variations:
+            names = [labels.get((attribute, value), value.replace('-', ' ').title())
+                     for attribute, value in variation.get('attributes', {}).items() if value]
+            image = variation.get('image') or {}
+            variant_image = image.get('url') or image.get('full_src') or image.get('src')
+            if not names or not variant_image:
+                continue
+            
+            if not variant_image.startswith('http'):
+                variant_image = self.base_url + variant_image
+            variant_name = ' / '.join(names)
+            product_data['variants'][variant_name] = [variant_image]
+            found = True
+            self.log(f"  🎨 {variant_name}: {variant_image}")
+        
+        return found
+    
+    def prefetch_store_api(self, per_page: int = 100) -> None:
+        """Precarga productos y variaciones desde la Store API de WooCommerce.
+        
+        Con unas pocas peticiones paginadas (`per_page`) se obtienen todos los
+        productos variables y sus variaciones con imagen; luego
+        get_product_variants_and_images los usa sin pedir cada página.
+        """
+        print("🛒 Precargando catálogo desde la Store API...")
+        products = self._fetch_store_api({}, per_page)
+        variations = self._fetch_store_api({'type': 'variation'}, per_page)
+        
+        by_id = {}
+        for item in products:
+            images = item.get('images') or []
+            by_id[item['id']] = self.store_api_products[item['slug']] = {
+                'variants': {},
+                'main_image': images[0]['src'] if images else None,
+                'raw': [item]
+            }
+        
+        for variation in variations:
+            parent = by_id.get(variation.get('parent'))
+            images = variation.get('images') or []
+            if not parent or not images:
+                continue
+            
+            # `variation` viene como "Color: Beige, Talla: M"
+            names = [part.split(': ', 1)[-1] for part in (variation.get('variation') or '').split(', ') if part]
+            variant_name = ' / '.join(names) or variation.get('name', 'default')
+            parent['variants'][variant_name] = [images[0]['src']]
+            parent['raw'].append(variation)
+        
+        print(f"✅ Store API: {len(self.store_api_products)} productos, {len(variations)} variaciones")
+    
+    def _fetch_store_api(self, params: Dict, per_page: int) -> List[Dict]:
+        items = []
+        page = 1
+        while True:
+            query = urllib.parse.urlencode(dict(params, per_page=per_page, page=page))
+            try:
+                batch = json.loads(self._fetch_page(f"{self.base_url}/wp-json/wc/store/products?{query}"))
+            except Exception as e:
+                print(f"⚠️  Error consultando la Store API: {e}")
+                break
+            
+            items.extend(batch)
+            if len(batch) < per_page:
+                break
+            page += 1
+        return items
+    
+    def _product_from_store_api(self, product: Dict, previous: Dict = None) -> Dict:
+        data = self.store_api_products[product['slug']]
+        fingerprint = hashlib.sha1(json.dumps(data['raw'], sort_keys=True).encode('utf-8')).hexdigest()
+        if previous and previous.get('fingerprint') == fingerprint:
+            self.log(f"⏭️  Sin cambios desde el reporte anterior: '{product['name']}'")
+            return {
+                'variants': previous['variants'],
+                'main_image': previous.get('main_image'),
+                'fingerprint': fingerprint,
+                'unchanged': True
+            }
+        
+        variants = dict(data['variants']) or {'default': [data['main_image']] if data['main_image'] else []}
+        self.log(f"✅ Producto '{product['name']}' (Store API): {len(variants)} variantes")
+        return {'variants': variants, 'main_image': data['main_image'], 'fingerprint': fingerprint}
+    
+    @staticmethod
+    def clean_product_name(product_name: str) -> str:
         """Limpia el nombre del producto removiendo precios"""
         # Remover patrones de precio como MXN $480.00, $480, etc.
         cleaned = re.sub(r'MXN\s*\$[\d,]+\.?\d*', '', product_name)
@@ -273,39 +1867,167 @@ class ArtesanaScraper:
             filename = filename[:100]
         return filename.strip()
     
-    def download_image(self, url: str, filepath: Path) -> bool:
-        """Descarga una imagen"""
-        # Si ya descargamos esta URL, no la volvemos a descargar
-        if url in self.downloaded_images:
-            return True
+    def download_image(self, url: str, filepath: Path) -> Dict:
+        """Descarga una imagen.
         
-        # Si el archivo ya existe, no lo volvemos a descargar
-        if filepath.exists():
-            print(f"⏭️  Ya existe: {filepath}")
-            self.downloaded_images.add(url)
-            return True
+        Devuelve el resultado estructurado de la descarga: ok, status
+        ('downloaded', 'not_modified', 'skipped', 'reused' o 'failed'),
+        bytes y sha256 (cuando se conoce sin releer el archivo). Con
+        `image_processor`, 'derivatives' es el Future de sus derivados.
+        """
+        with self.profiler.stage('download_image') as metrics:
+            if self.content_store:
+                status, digest = self._download_to_store(url, filepath)
+            else:
+                status, digest = self._download_file(url, filepath)
+            
+            size = filepath.stat().st_size if status != 'failed' and filepath.exists() else 0
+            metrics['bytes'] = size
+        
+        result = {'ok': status != 'failed', 'status': status, 'bytes': size, 'sha256': digest}
+        # Los derivados se generan en otro proceso mientras siguen las descargas
+        if self.image_processor and result['ok'] and filepath.exists():
+            result['derivatives'] = self.image_processor.submit(filepath, digest)
+        return result
+    
+    def _download_file(self, url: str, filepath: Path) -> Tuple[str, str]:
+        # Si ya descargamos esta URL a esta misma ruta, no la volvemos a descargar
+        with self.lock:
+            if url in self.downloaded_images and filepath.exists():
+                return 'skipped', None
+        
+        # Descargada en una ejecución anterior que se interrumpió
+        if self.journal and self.journal.has_image(url, filepath):
+            with self.lock:
+                self.downloaded_images.add(url)
+            return 'skipped', None
+        
+        # Si el archivo ya existe, no lo volvemos a descargar; con caché se
+        # revalida y sólo se baja de nuevo si el servidor dice que cambió
+        entry = self.cache.load(url) if self.cache and filepath.exists() else None
+        if filepath.exists() and not entry:
+            self.log(f"⏭️  Ya existe: {filepath}")
+            self._mark_downloaded(url, filepath)
+            return 'skipped', None
             
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            headers = self.cache.conditional_headers(entry) if entry else {}
+            with self._request(url, stream=True, headers=headers) as response:
+                if response.status_code == 304:
+                    self.cache.record(hit=True)
+                    self.log(f"⏭️  Sin cambios: {filepath}")
+                    self._mark_downloaded(url, filepath)
+                    return 'not_modified', None
+                
+                response.raise_for_status()
+                
+                # Crear directorio si no existe
+                filepath.parent.mkdir(parents=True, exist_ok=True)
+                hasher = hashlib.sha256()
+                self._stream_to_file(response, filepath, hasher=hasher)
+                
+                if self.cache:
+                    self.cache.record(hit=False)
+                    self.cache.store(url, response)
             
-            # Crear directorio si no existe
-            filepath.parent.mkdir(parents=True, exist_ok=True)
+            self._mark_downloaded(url, filepath)
+            return 'downloaded', hasher.hexdigest()
             
-            # Escribir archivo
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+        except Exception as e:
+            print(f"❌ Error descargando {url}: {e}")
+            return 'failed', None
+    
+    def _download_to_store(self, url: str, filepath: Path) -> Tuple[str, str]:
+        """Descarga vía el almacén direccionado por contenido.
+        
+        Se pide la imagen original (sin sufijo -300x300/-scaled) y, si no
+        existe, la URL tal cual. Una misma foto usada por varias variantes o
+        productos se descarga y guarda una sola vez.
+        """
+        if self.journal and self.journal.has_image(url, filepath):
+            return 'skipped', None
+        
+        store = self.content_store
+        key = store.normalize_url(url)
+        blob = store.lookup(key)
+        if blob:
+            store.record_reuse()
+            store.link(blob, filepath)
+            self._mark_downloaded(url, filepath)
+            return 'reused', blob.stem
+        
+        store.store_dir.mkdir(parents=True, exist_ok=True)
+        for candidate in dict.fromkeys([key, url]):
+            try:
+                with self._request(candidate, stream=True) as response:
+                    if response.status_code == 404 and candidate != url:
+                        continue
+                    response.raise_for_status()
+                    
+                    hasher = hashlib.sha256()
+                    incoming = store.store_dir / f"incoming-{uuid.uuid4().hex}.part"
+                    self._stream_to_file(response, incoming, hasher=hasher)
+                
+                ext = os.path.splitext(urllib.parse.urlparse(candidate).path)[1] or '.jpg'
+                blob = store.add(key, incoming, hasher.hexdigest(), ext.lower())
+                store.link(blob, filepath)
+                self._mark_downloaded(url, filepath)
+                return 'downloaded', hasher.hexdigest()
             
+            except Exception as e:
+                print(f"❌ Error descargando {candidate}: {e}")
+                return 'failed', None
+        return 'failed', None
+    
+    def _mark_downloaded(self, url: str, filepath: Path) -> None:
+        with self.lock:
             self.downloaded_images.add(url)
-            time.sleep(self.delay)
-            return True
+        if self.journal:
+            self.journal.record_image(url, filepath)
+    
+    def _stream_to_file(self, response: requests.Response, filepath: Path, chunk_size: int = 64 * 1024,
+                        hasher=None) -> int:
+        """Escribe la respuesta por bloques en un temporal y lo renombra al terminar.
+        
+        Así la memoria no depende del tamaño de la imagen y una descarga
+        interrumpida nunca deja un archivo truncado en la ruta final.
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix='.part')
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+                        if hasher:
+                            hasher.update(chunk)
             
-        except Exception as e:
-            print(f"❌ Error descargando {url}: {e}")
-            return False
+            # Si el servidor anunció el tamaño, verificar que llegó completo
+            expected = response.headers.get('Content-Length')
+            if expected and 'Content-Encoding' not in response.headers and written != int(expected):
+                raise IOError(f"descarga incompleta ({written} de {expected} bytes)")
+            
+            # mkstemp crea el archivo con permisos 0600
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, filepath)
+            return written
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
     
-    def scrape_products(self, dry_run: bool = False, max_products: int = None) -> Dict:
-        """Scraping principal"""
+    def scrape_products(self, dry_run: bool = False, max_products: int = None,
+                        previous_report: Dict = None, report_writer: ReportWriter = None) -> Dict:
+        """Scraping principal.
+        
+        Con `previous_report` se hace un re-scrape incremental: los productos
+        cuya huella no cambió conservan sus datos y descargas anteriores, y el
+        resultado se combina con el reporte previo en lugar de reemplazarlo.
+        
+        Con `report_writer` cada producto se escribe al terminar y no se
+        guarda en results['categories'] (que sólo conserva nombre y slug).
+        """
         print("🚀 Iniciando scraping de Estudio Artesana")
         print(f"📍 URL base: {self.base_url}")
         print(f"🔧 Modo: {'DRY RUN' if dry_run else 'DESCARGA'}")
@@ -314,28 +2036,37 @@ class ArtesanaScraper:
             'categories': [],
             'total_products': 0,
             'total_images': 0,
-            'errors': []
+            'errors': [],
+            'recovered': []
         }
         
+        if self.engine == 'store-api':
+            self.prefetch_store_api()
+        
         # Obtener categorías
         categories = self.get_categories()
         if not categories:
             print("❌ No se encontraron categorías")
             return results
         
+        # Fase 1: listados de categorías, en lotes del tamaño del pool para no
+        # pedir categorías que el límite de productos ya no alcanzaría
+        work = []
+        discovered = {}
         product_count = 0
+        previous_products = self._index_report(previous_report)
         
-        for category in categories:
-            print(f"\n📂 Procesando categoría: {category['name']}")
+        def add_category(category: Dict, products: List[Dict]) -> None:
+            nonlocal product_count
+            discovered[category['slug']] = products
+            self.log(f"\n📂 Procesando categoría: {category['name']}")
             
             category_data = {
                 'name': category['name'],
                 'slug': category['slug'],
                 'products': []
             }
-            
-            # Obtener productos de la categoría
-            products = self.get_products_from_category(category)
+            results['categories'].append(category_data)
             
             for product in products:
                 if max_products and product_count >= max_products:
@@ -343,19 +2074,89 @@ class ArtesanaScraper:
                     break
                 
                 product_count += 1
-                print(f"\n📦 Producto {product_count}: {product['name']}")
+                work.append((category, category_data, product, product_count))
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in range(0, len(categories), self.workers):
+                if max_products and product_count >= max_products:
+                    break
                 
-                # Obtener variantes e imágenes
-                product_info = self.get_product_variants_and_images(product)
+                batch = categories[start:start + self.workers]
+                for category, products in zip(batch, executor.map(self._load_category, batch)):
+                    if max_products and product_count >= max_products:
+                        break
+                    add_category(category, products)
+            
+            # Productos del sitemap que no aparecen en ningún listado
+            if self.sitemap_products and not (max_products and product_count >= max_products):
+                orphans = self._orphan_products(discovered)
+                if orphans:
+                    print(f"⚠️  {len(orphans)} productos del sitemap sin categoría en los listados")
+                    add_category({'name': 'Sin Categoria', 'slug': 'sin-categoria', 'url': None}, orphans)
+        
+        # Fase 2: páginas de producto y descargas, en este proceso o repartidas
+        # por categoría entre varios (--processes); el límite ya se aplicó arriba
+        if self.processes > 1 and work:
+            self._scrape_sharded(work, results, dry_run, previous_products, report_writer)
+        else:
+            self._scrape_work(work, results, dry_run, previous_products, report_writer)
+        
+        if self.content_store:
+            self.content_store.save()
+        
+        results['errors'].extend(self.page_errors)
+        results['recovered'] = list(self.recovered)
+        
+        if previous_report:
+            self._merge_previous_report(results, previous_report, discovered)
+        
+        for category_data in results['categories']:
+            results['total_products'] += len(category_data['products'])
+        
+        return results
+    
+    def _scrape_work(self, work: List[Tuple], results: Dict, dry_run: bool, previous_products: Dict,
+                     report_writer: ReportWriter = None) -> None:
+        """Fase 2: páginas de producto y descargas de la lista `work`"""
+        pending = deque()
+        pipeline = None if dry_run else DownloadPipeline(self.download_image, self.download_workers, log=self.log)
+        
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            # map conserva el orden de `work`, así que el reporte queda igual entre ejecuciones
+            product_infos = executor.map(
+                lambda item: self._load_product(item[2], previous_products.get(item[2]['url'])), work)
+            
+            for (category, category_data, product, number), product_info in zip(work, product_infos):
+                self.log(f"\n📦 Producto {number}: {product['name']}")
                 
                 product_data = {
                     'name': product['name'],
                     'slug': product['slug'],
+                    'url': product['url'],
+                    'fingerprint': product_info.get('fingerprint'),
+                    'lastmod': product.get('lastmod'),
+                    'main_image': product_info.get('main_image'),
                     'variants': product_info['variants'],
-                    'downloaded_images': []
+                    'downloaded_images': [],
+                    # Resultado de la descarga por variante: url, path, bytes, status, sha256
+                    'variant_downloads': {}
                 }
+                if product_info.get('fetch_failed'):
+                    product_data['fetch_failed'] = True
                 
-                if not dry_run:
+                jobs = []
+                # Una entrada "sin cambios" repetida desde la bitácora con --resume puede
+                # no tener reporte anterior: entonces se descarga como un producto nuevo
+                if product_info.get('unchanged') and product['url'] in previous_products:
+                    # Mismas imágenes que en la ejecución anterior: no se descargan
+                    previous_product = previous_products[product['url']]
+                    product_data['downloaded_images'] = list(previous_product['downloaded_images'])
+                    product_data['variant_downloads'] = dict(previous_product.get('variant_downloads', {}))
+                    if previous_product.get('main_image_download'):
+                        product_data['main_image_download'] = previous_product['main_image_download']
+                    product_data['unchanged'] = True
+                elif not dry_run:
                     # Limpiar nombre del producto (quitar precio)
                     clean_product_name = self.clean_product_name(product['name'])
                     
@@ -370,12 +2171,7 @@ class ArtesanaScraper:
                         # Crear path para imagen principal
                         main_img_path = Path("scraper") / self.sanitize_filename(category['name']) / self.sanitize_filename(clean_product_name) / f"principal{file_ext}"
                         
-                        if self.download_image(main_img_url, main_img_path):
-                            product_data['downloaded_images'].append(str(main_img_path))
-                            results['total_images'] += 1
-                            print(f"✅ Imagen principal: {main_img_path}")
-                        else:
-                            results['errors'].append(f"Error descargando imagen principal {main_img_url}")
+                        jobs.append(pipeline.submit(main_img_url, main_img_path, kind='principal'))
                     
                     # Descargar una imagen por variante directamente como archivo
                     if product_info['variants']:
@@ -393,28 +2189,313 @@ class ArtesanaScraper:
                                 img_filename = f"{variant_clean}{file_ext}"
                                 img_path = Path("scraper") / self.sanitize_filename(category['name']) / self.sanitize_filename(clean_product_name) / img_filename
                                 
-                                if self.download_image(img_url, img_path):
-                                    product_data['downloaded_images'].append(str(img_path))
-                                    results['total_images'] += 1
-                                    print(f"✅ Variante: {img_path}")
-                                else:
-                                    results['errors'].append(f"Error descargando {img_url}")
-                
-                category_data['products'].append(product_data)
+                                jobs.append(pipeline.submit(img_url, img_path, variant=variant_name))
                 
-                if max_products and product_count >= max_products:
-                    break
+                if not report_writer:
+                    category_data['products'].append(product_data)
+                pending.append((category_data, product_data, jobs))
+                self._collect_downloads(pending, results, report_writer=report_writer)
+        except BaseException:
+            # Ctrl-C o error: no se piden más páginas y las descargas en cola se descartan;
+            # las que están en curso terminan antes de que main() cierre la bitácora
+            executor.shutdown(cancel_futures=True)
+            if pipeline:
+                pipeline.cancel()
+            raise
+        executor.shutdown()
+        
+        # Esperar las descargas que sigan en vuelo
+        if pipeline:
+            pipeline.close()
+            results['downloads'] = pipeline.stats()
+        self._collect_downloads(pending, results, wait=True, report_writer=report_writer)
+    
+    def shard_config(self) -> Dict:
+        """Argumentos para reconstruir este scraper en un proceso de --processes.
+        
+        La tasa por host se reparte entre los procesos para que el sitio vea
+        el mismo presupuesto total que con uno solo.
+        """
+        return {
+            'base_url': self.base_url, 'delay': self.delay, 'workers': self.workers,
+            'rate': self.rate_limiter.max_rate / self.processes, 'download_workers': self.download_workers,
+            'cache_dir': str(self.cache.cache_dir) if self.cache else None, 'parser': self.parser,
+            'use_sitemap': False, 'engine': self.engine, 'retries': self.retries, 'backoff': self.backoff,
+            'connect_timeout': self.timeout[0], 'read_timeout': self.timeout[1],
+            'http2': isinstance(self.session, Http2Session), 'quiet': self.quiet
+        }
+    
+    def _scrape_sharded(self, work: List[Tuple], results: Dict, dry_run: bool, previous_products: Dict,
+                        report_writer: ReportWriter = None) -> None:
+        """Fase 2 repartida por categoría entre `self.processes` procesos.
+        
+        El parseo de BeautifulSoup es CPU y el GIL lo deja en un núcleo; cada
+        proceso tiene su sesión, su bitácora en scraper/shards/shard-N y su
+        perfil, y aquí se juntan los resultados en el orden original de `work`.
+        """
+        # Categorías completas a cada proceso, la más grande al menos cargado
+        by_category = {}
+        for category, category_data, product, number in work:
+            by_category.setdefault(category_data['slug'], []).append((category, product, number))
+        shards = [[] for _ in range(min(self.processes, len(by_category)))]
+        for items in sorted(by_category.values(), key=len, reverse=True):
+            min(shards, key=len).extend(items)
+        # Cada proceso recorre sus productos en el orden global, así sus reportes se pueden intercalar
+        for items in shards:
+            items.sort(key=lambda item: item[2])
+        
+        print(f"🧩 {len(work)} productos en {len(by_category)} categorías repartidos en {len(shards)} procesos")
+        options = {
+            'dry_run': dry_run,
+            'journal': self.journal is not None,
+            'resume': bool(self.journal and self.journal.resumed),
+            'rules': str(self.rules.path),
+            'content_store': str(self.content_store.store_dir) if self.content_store else None,
+            'derivatives': None,
+            # Con --stream-reports cada proceso escribe su propio JSONL en vez de devolver los productos
+            'stream': report_writer is not None
+        }
+        if self.image_processor:
+            # El pool de derivados también se reparte entre los procesos
+            settings = dict(self.image_processor.settings)
+            settings['processes'] = max(1, (settings['processes'] or os.cpu_count() or 1) // len(shards))
+            options['derivatives'] = settings
+        
+        slots = {number: category_data for _, category_data, _, number in work}
+        finished = {}
+        streams = []
+        # spawn: procesos limpios, sin heredar los hilos ni sockets de éste
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = []
+            for index, items in enumerate(shards):
+                urls = {product['url'] for _, product, _ in items}
+                slugs = {product['slug'] for _, product, _ in items}
+                shard_options = dict(options,
+                                     previous_products={url: previous_products[url] for url in urls if url in previous_products},
+                                     store_api_products={slug: self.store_api_products[slug]
+                                                         for slug in slugs if slug in self.store_api_products})
+                futures.append(executor.submit(run_shard, self.shard_config(), index, items, shard_options))
             
-            results['categories'].append(category_data)
-            results['total_products'] += len(category_data['products'])
+            for future in futures:
+                shard = future.result()
+                finished.update(shard['products'])
+                if shard.get('stream'):
+                    streams.append(shard['stream'])
+                results['total_images'] += shard['total_images']
+                results['errors'].extend(shard['errors'])
+                self.page_errors.extend(shard['page_errors'])
+                self.recovered.extend(shard['recovered'])
+                if 'downloads' in shard:
+                    downloads = results.setdefault('downloads', {'submitted': 0, 'completed': 0, 'failed': 0})
+                    for key, value in shard['downloads'].items():
+                        downloads[key] += value
+                self.profiler.merge(shard['profile'])
+                self.shard_connections.append(shard['connections'])
+                if self.cache:
+                    self.cache.merge_stats(shard['cache'])
+                if self.content_store:
+                    self.content_store.merge(shard['content_store']['index'], shard['content_store']['stats'])
+                if self.image_processor:
+                    self.image_processor.merge(shard['derivatives']['updates'], shard['derivatives']['stats'])
+                print(f"✅ Proceso {shard['shard']}: {shard['total_products']} productos en {shard['wall_time_s']} s")
+        
+        if report_writer:
+            self._merge_shard_streams(streams, slots, results, report_writer)
+        for number in sorted(finished):
+            slots[number]['products'].append(finished[number])
+    
+    def _merge_shard_streams(self, streams: List[Dict], slots: Dict, results: Dict,
+                             report_writer: ReportWriter) -> None:
+        """Intercala los JSONL de los procesos por número de producto, una línea a la vez"""
+        def records(stream: Dict):
+            for (_, product), number in zip(ReportWriter.read_records(stream['path']), stream['numbers']):
+                yield number, product
+        
+        for number, product in heapq.merge(*(records(stream) for stream in streams), key=lambda item: item[0]):
+            report_writer.write_product(slots[number], product)
+            results['total_products'] += 1
+        for stream in streams:
+            Path(stream['path']).unlink()
+    
+    def _orphan_products(self, discovered: Dict) -> List[Dict]:
+        """Productos del sitemap que no aparecieron en ningún listado de categoría"""
+        listed = {product['slug'] for products in discovered.values() for product in products}
+        orphans = []
+        for slug, entry in self.sitemap_products.items():
+            if slug not in listed:
+                orphans.append({
+                    'name': slug.replace('-', ' ').title(),
+                    'slug': slug,
+                    'url': entry['url'],
+                    'category': 'sin-categoria',
+                    'lastmod': entry['lastmod']
+                })
+        return orphans
+    
+    def _index_report(self, report: Dict) -> Dict:
+        """Indexa los productos de un reporte por URL"""
+        index = {}
+        if report:
+            for category in report['categories']:
+                for product in category['products']:
+                    if product.get('url'):
+                        index[product['url']] = product
+        return index
+    
+    def _merge_previous_report(self, results: Dict, previous_report: Dict, discovered: Dict) -> None:
+        """Combina el resultado incremental con el reporte anterior.
+        
+        - Categorías no visitadas en esta ejecución se conservan tal cual.
+        - Productos listados pero no procesados (por --max-products) conservan
+          su entrada anterior, igual que los que fallaron al pedir su página.
+        - Productos que ya no aparecen en el listado se quitan y se anotan en
+          results['incremental']['removed'].
+        """
+        stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'failed': 0, 'removed': []}
+        processed = {category['slug']: category for category in results['categories']}
+        previous_categories = {category['slug']: category for category in previous_report['categories']}
+        
+        for category_data in results['categories']:
+            previous_products = {product['slug']: product
+                                 for product in previous_categories.get(category_data['slug'], {}).get('products', [])}
+            current = {product['slug']: product for product in category_data['products']}
             
-            if max_products and product_count >= max_products:
-                break
+            merged = []
+            for product in discovered.get(category_data['slug'], []):
+                if product['slug'] in current:
+                    product_data = current[product['slug']]
+                    if product_data.get('fetch_failed') and product['slug'] in previous_products:
+                        # La página no se pudo obtener: queda la entrada buena del reporte anterior
+                        stats['failed'] += 1
+                        merged.append(previous_products[product['slug']])
+                        continue
+                    if product_data.get('unchanged'):
+                        stats['unchanged'] += 1
+                    elif product['slug'] in previous_products:
+                        stats['changed'] += 1
+                    else:
+                        stats['new'] += 1
+                    merged.append(product_data)
+                elif product['slug'] in previous_products:
+                    merged.append(previous_products[product['slug']])
+            
+            listed = {product['slug'] for product in discovered.get(category_data['slug'], [])}
+            for slug in previous_products:
+                if slug not in listed:
+                    stats['removed'].append(f"{category_data['slug']}/{slug}")
+            
+            category_data['products'] = merged
         
-        return results
+        # Categorías del reporte anterior que no se visitaron, en su orden original
+        merged_categories = []
+        for category in previous_report['categories']:
+            merged_categories.append(processed.pop(category['slug'], category))
+        merged_categories.extend(processed.values())
+        results['categories'] = merged_categories
+        
+        results['total_images'] = sum(len(product['downloaded_images'])
+                                      for category in results['categories']
+                                      for product in category['products'])
+        results['incremental'] = stats
+        print(f"🔁 Incremental: {stats['new']} nuevos, {stats['changed']} modificados, "
+              f"{stats['unchanged']} sin cambios, {stats['failed']} conservados tras fallar, "
+              f"{len(stats['removed'])} eliminados")
+    
+    def _load_category(self, category: Dict) -> List[Dict]:
+        """Listado de productos de una categoría, desde la bitácora si ya se hizo"""
+        if self.journal and category['slug'] in self.journal.categories:
+            self.log(f"📒 Categoría '{category['name']}' ya registrada en la bitácora")
+            return self.journal.categories[category['slug']]
+        
+        products = self.get_products_from_category(category)
+        for product in products:
+            product['lastmod'] = self.sitemap_products.get(product['slug'], {}).get('lastmod')
+        
+        # Un listado vacío puede ser un error de red: no se registra
+        if self.journal and products:
+            self.journal.record_category(category['slug'], products)
+        return products
+    
+    def _load_product(self, product: Dict, previous: Dict = None) -> Dict:
+        """Variantes e imágenes de un producto, desde la bitácora si ya se hizo"""
+        if self.journal and product['url'] in self.journal.products:
+            self.log(f"📒 Producto '{product['name']}' ya registrado en la bitácora")
+            return self.journal.products[product['url']]
+        
+        # El sitemap dice que no se modificó: ni siquiera se pide la página
+        # (salvo que la entrada anterior venga de una página que no se pudo obtener)
+        if (previous and product.get('lastmod') and previous.get('lastmod') == product['lastmod']
+                and previous['variants'] and not previous.get('fetch_failed')):
+            self.log(f"⏭️  Sin cambios según el sitemap: '{product['name']}'")
+            return {
+                'variants': previous['variants'],
+                'main_image': previous.get('main_image'),
+                'fingerprint': previous.get('fingerprint'),
+                'unchanged': True
+            }
+        
+        product_info = self.get_product_variants_and_images(product, previous)
+        # Sin variantes significa que la página no se pudo obtener
+        if self.journal and product_info['variants']:
+            self.journal.record_product(product['url'], product_info)
+        return product_info
+    
+    def _job_finished(self, job: Dict) -> bool:
+        """Descarga terminada y, si hay derivados, también generados"""
+        if not job['done'].is_set():
+            return False
+        derivatives = (job['result'] or {}).get('derivatives')
+        return derivatives is None or derivatives.done()
+    
+    def _collect_downloads(self, pending: deque, results: Dict, wait: bool = False,
+                           report_writer: ReportWriter = None) -> None:
+        """Vuelca al reporte las descargas terminadas, respetando el orden de los productos"""
+        while pending:
+            category_data, product_data, jobs = pending[0]
+            if not wait and not all(self._job_finished(job) for job in jobs):
+                break
+            
+            pending.popleft()
+            for job in jobs:
+                job['done'].wait()
+                result = job['result'] or {'status': 'failed', 'bytes': 0, 'sha256': None}
+                download = {'url': job['url'], 'path': str(job['path']), 'bytes': result['bytes'],
+                            'status': result['status'], 'sha256': result['sha256']}
+                if result.get('derivatives'):
+                    try:
+                        download['derivatives'] = result['derivatives'].result()
+                    except Exception as e:
+                        download['derivatives'] = {}
+                        results['errors'].append(f"Error generando derivados de {job['path']}: {e}")
+                if job['kind'] == 'principal':
+                    product_data['main_image_download'] = download
+                else:
+                    product_data['variant_downloads'][job['variant']] = download
+                
+                if job['ok']:
+                    product_data['downloaded_images'].append(str(job['path']))
+                    results['total_images'] += 1
+                    if job['kind'] == 'principal':
+                        self.log(f"✅ Imagen principal: {job['path']}")
+                    else:
+                        self.log(f"✅ Variante: {job['path']}")
+                elif job['kind'] == 'principal':
+                    results['errors'].append(f"Error descargando imagen principal {job['url']}")
+                else:
+                    results['errors'].append(f"Error descargando {job['url']}")
+            
+            if report_writer:
+                report_writer.write_product(category_data, product_data)
+                results['total_products'] += 1
     
     def save_csv_report(self, results: Dict, filename: str = "scraper/productos_scrapeados.csv") -> None:
         """Guarda un reporte CSV con toda la información scrapeada"""
+        with self.profiler.stage('save_csv_report') as metrics:
+            self._save_csv_report(results, filename)
+            if os.path.exists(filename):
+                metrics['bytes'] = os.path.getsize(filename)
+    
+    def _save_csv_report(self, results: Dict, filename: str) -> None:
         print(f"📄 Generando reporte CSV: {filename}")
         
         # Crear directorio si no existe
@@ -425,33 +2506,12 @@ class ArtesanaScraper:
         
         for category in results['categories']:
             for product in category['products']:
-                # Una fila por cada variante del producto
-                for variant_name, variant_images in product['variants'].items():
-                    # Filtrar rutas descargadas para esta variante específica
-                    variant_paths = [path for path in product['downloaded_images'] 
-                                   if self.sanitize_filename(variant_name) in path]
-                    
-                    row = {
-                        'categoria': category['name'],
-                        'categoria_slug': category['slug'],
-                        'producto': product['name'],
-                        'producto_slug': product['slug'],
-                        'variante': variant_name,
-                        'precio': self.extract_price(product['name']),
-                        'total_imagenes': len(variant_images),
-                        'imagenes_descargadas': len(variant_paths),
-                        'urls_imagenes': ' | '.join(variant_images),
-                        'rutas_descargadas': ' | '.join(variant_paths),
-                    }
-                    csv_data.append(row)
+                csv_data.extend(self.csv_rows(category, product))
         
         # Escribir CSV
         if csv_data:
-            fieldnames = ['categoria', 'categoria_slug', 'producto', 'producto_slug', 'variante', 'precio', 
-                         'total_imagenes', 'imagenes_descargadas', 'urls_imagenes', 'rutas_descargadas']
-            
             with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
                 writer.writeheader()
                 writer.writerows(csv_data)
             
@@ -459,6 +2519,37 @@ class ArtesanaScraper:
         else:
             print("⚠️  No hay datos para guardar en CSV")
     
+    def csv_rows(self, category: Dict, product: Dict) -> List[Dict]:
+        """Filas del CSV para un producto: una por cada variante"""
+        rows = []
+        downloads = product.get('variant_downloads') or {}
+        if not downloads and product.get('downloaded_images'):
+            # Reporte anterior sin el índice: el archivo de cada variante se
+            # llama exactamente como la variante (scraper/Cat/Prod/<variante>.ext)
+            by_stem = {Path(path).stem: path for path in product['downloaded_images']}
+            downloads = {name: {'path': by_stem[self.sanitize_filename(name)], 'status': 'skipped'}
+                         for name in product['variants'] if self.sanitize_filename(name) in by_stem}
+        
+        for variant_name, variant_images in product['variants'].items():
+            download = downloads.get(variant_name)
+            variant_paths = [download['path']] if download and download['status'] != 'failed' else []
+            derivative_paths = list((download or {}).get('derivatives', {}).values())
+            
+            rows.append({
+                'categoria': category['name'],
+                'categoria_slug': category['slug'],
+                'producto': product['name'],
+                'producto_slug': product['slug'],
+                'variante': variant_name,
+                'precio': self.extract_price(product['name']),
+                'total_imagenes': len(variant_images),
+                'imagenes_descargadas': len(variant_paths),
+                'urls_imagenes': ' | '.join(variant_images),
+                'rutas_descargadas': ' | '.join(variant_paths),
+                'rutas_derivados': ' | '.join(derivative_paths),
+            })
+        return rows
+    
     def extract_price(self, product_name: str) -> str:
         """Extrae el precio del nombre del producto"""
         import re
@@ -466,17 +2557,156 @@ class ArtesanaScraper:
         price_match = re.search(r'(MXN \$[\d,]+\.?\d*|\$[\d,]+\.?\d*)', product_name)
         return price_match.group(1) if price_match else ''
 
+def run_shard(config: Dict, shard: int, items: List[Tuple[Dict, Dict, int]], options: Dict) -> Dict:
+    """Proceso de --processes: procesa los productos de sus categorías.
+    
+    Devuelve {número de producto: product_data} más errores, contadores y el
+    perfil, para que el proceso principal arme un solo reporte.
+    """
+    shard_dir = Path("scraper") / "shards" / f"shard-{shard}"
+    journal = CrawlJournal(str(shard_dir / "crawl_journal.jsonl"), resume=options['resume']) if options['journal'] else None
+    content_store = ContentStore(options['content_store']) if options['content_store'] else None
+    # El manifiesto de derivados lo guarda el proceso principal
+    image_processor = ImageProcessor(persist=False, **options['derivatives']) if options['derivatives'] else None
+    scraper = ArtesanaScraper(journal=journal, content_store=content_store, image_processor=image_processor,
+                              rules=ExtractionRules(options['rules']), **config)
+    scraper.store_api_products = options['store_api_products']
+    report_writer = ReportWriter(None, str(shard_dir / "productos.jsonl"), csv_path=None) if options['stream'] else None
+    
+    # Una copia local de cada categoría para que _scrape_work agregue sus productos
+    categories = {}
+    work = []
+    for category, product, number in items:
+        category_data = categories.setdefault(category['slug'], {'name': category['name'], 'slug': category['slug'],
+                                                                 'products': []})
+        work.append((category, category_data, product, number))
+    
+    results = {'categories': list(categories.values()), 'total_products': 0, 'total_images': 0,
+               'errors': [], 'recovered': []}
+    try:
+        scraper._scrape_work(work, results, options['dry_run'], options['previous_products'], report_writer)
+    finally:
+        if journal:
+            journal.close()
+        if report_writer:
+            report_writer.close()
+        if image_processor:
+            image_processor.close()
+    
+    # Dentro de cada categoría los productos quedan en el orden de `work` (en modo stream, en el JSONL)
+    positions = {slug: iter(category_data['products']) for slug, category_data in categories.items()}
+    products = {} if report_writer else {number: next(positions[category['slug']]) for category, _, number in items}
+    
+    shard_results = {
+        'shard': shard,
+        'products': products,
+        'total_products': report_writer.products if report_writer else len(products),
+        'total_images': results['total_images'],
+        'errors': results['errors'],
+        'page_errors': scraper.page_errors,
+        'recovered': scraper.recovered,
+        'profile': scraper.profiler.stages,
+        'wall_time_s': scraper.profiler.to_dict()['wall_time_s'],
+        'connections': scraper.connection_stats(),
+        'cache': scraper.cache.stats() if scraper.cache else None
+    }
+    if 'downloads' in results:
+        shard_results['downloads'] = results['downloads']
+    if report_writer:
+        # Los productos quedan en el JSONL, en el orden de `items`
+        shard_results['stream'] = {'path': str(report_writer.jsonl_path),
+                                   'numbers': [number for _, _, number in items]}
+    if content_store:
+        shard_results['content_store'] = {'index': content_store.index, 'stats': content_store.stats()}
+    if image_processor:
+        shard_results['derivatives'] = {'updates': image_processor.updates, 'stats': image_processor.stats()}
+    return shard_results
+
 def main():
     parser = argparse.ArgumentParser(description='Scraper para Estudio Artesana')
     parser.add_argument('--dry-run', action='store_true', help='Ejecutar en modo dry-run (no descargar)')
     parser.add_argument('--max-products', type=int, default=5, help='Máximo número de productos (default: 5)')
     parser.add_argument('--delay', type=float, default=1.0, help='Delay entre requests en segundos')
     parser.add_argument('--base-url', default='http://estudioartesana.local', help='URL base del sitio')
+    parser.add_argument('--workers', type=int, default=1, help='Páginas descargadas en paralelo (default: 1)')
+    parser.add_argument('--download-workers', type=int, default=4, help='Descargas de imágenes en paralelo (default: 4)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Procesos para páginas de producto y descargas, repartidos por categoría (default: 1)')
+    parser.add_argument('--since-report', default=None,
+                        help='Re-scrape incremental contra un reporte anterior (ej. scraper/scraping_report.json)')
+    parser.add_argument('--stream-reports', action='store_true',
+                        help='Escribir scraper/productos.jsonl y el CSV a medida que termina cada producto')
+    parser.add_argument('--resume', action='store_true', help='Continuar una ejecución interrumpida usando scraper/crawl_journal.jsonl')
+    parser.add_argument('--content-store', action='store_true',
+                        help='Guardar imágenes una sola vez por contenido en scraper/.blobs y enlazarlas en cada carpeta')
+    parser.add_argument('--webp', action='store_true', help='Generar una copia WebP de cada imagen descargada (requiere Pillow)')
+    parser.add_argument('--webp-quality', type=int, default=80, help='Calidad de los WebP (default: 80)')
+    parser.add_argument('--thumbnails', default=None,
+                        help='Anchos de miniatura separados por coma, ej. 300,600 (requiere Pillow)')
+    parser.add_argument('--image-processes', type=int, default=None,
+                        help='Procesos para generar derivados (default: núcleos disponibles)')
+    parser.add_argument('--export-sql', default=None,
+                        help='Exportar el catálogo como upserts SQL para Postgres/Supabase (ej. scraper/catalogo.sql)')
+    parser.add_argument('--export-sqlite', default=None,
+                        help='Cargar el catálogo con los mismos upserts en una base SQLite (ej. scraper/catalogo.db)')
+    parser.add_argument('--export-batch', type=int, default=500, help='Filas por INSERT en la exportación SQL (default: 500)')
+    parser.add_argument('--no-cache', action='store_true', help='No usar la caché HTTP condicional (scraper/.http_cache)')
+    parser.add_argument('--no-sitemap', action='store_true', help='No usar los sitemaps XML para descubrir categorías y productos')
+    parser.add_argument('--engine', choices=['html', 'variations', 'store-api'], default='html',
+                        help='Extracción de variantes: swatches HTML, JSON data-product_variations o Store API (default: html)')
+    parser.add_argument('--parser', choices=['lxml', 'html.parser'], default='lxml',
+                        help='Backend de BeautifulSoup (default: lxml)')
+    parser.add_argument('--rules', default=str(DEFAULT_RULES),
+                        help='Reglas de extracción de la página de producto (default: utilities/extraction_rules.json)')
+    parser.add_argument('--retries', type=int, default=3, help='Reintentos ante timeouts y HTTP 429/502/503/504 (default: 3)')
+    parser.add_argument('--backoff', type=float, default=1.0, help='Espera base del backoff exponencial en segundos (default: 1.0)')
+    parser.add_argument('--connect-timeout', type=float, default=5.0, help='Timeout de conexión en segundos (default: 5)')
+    parser.add_argument('--read-timeout', type=float, default=30.0, help='Timeout de lectura en segundos (default: 30)')
+    parser.add_argument('--http2', action='store_true', help='Usar httpx con HTTP/2 en lugar de requests (requiere httpx[http2])')
+    parser.add_argument('--quiet', action='store_true', help='Sin mensajes por producto/imagen; sólo el resumen final')
+    parser.add_argument('--prometheus', action='store_true', help='Escribir también scraper/run_profile.prom (formato Prometheus)')
+    parser.add_argument('--rate', type=float, default=None, help='Máximo de requests por segundo por host (default: 1/delay)')
     
     args = parser.parse_args()
+    if args.stream_reports and args.since_report:
+        parser.error('--stream-reports no se puede combinar con --since-report (la combinación necesita el reporte en memoria)')
     
-    scraper = ArtesanaScraper(base_url=args.base_url, delay=args.delay)
-    results = scraper.scrape_products(dry_run=args.dry_run, max_products=args.max_products)
+    journal = CrawlJournal("scraper/crawl_journal.jsonl", resume=args.resume)
+    image_processor = None
+    if args.webp or args.thumbnails:
+        thumbnails = [int(width) for width in args.thumbnails.split(',')] if args.thumbnails else []
+        image_processor = ImageProcessor(webp=args.webp, webp_quality=args.webp_quality, thumbnails=thumbnails,
+                                         processes=args.image_processes)
+    scraper = ArtesanaScraper(base_url=args.base_url, delay=args.delay, workers=args.workers, rate=args.rate,
+                             download_workers=args.download_workers,
+                             cache_dir=None if args.no_cache else "scraper/.http_cache",
+                             journal=journal, parser=args.parser,
+                             use_sitemap=not args.no_sitemap, engine=args.engine,
+                             content_store=ContentStore("scraper/.blobs") if args.content_store else None,
+                             retries=args.retries, backoff=args.backoff,
+                             connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                             http2=args.http2, quiet=args.quiet, rules=ExtractionRules(args.rules),
+                             processes=args.processes, image_processor=image_processor)
+    previous_report = None
+    if args.since_report:
+        with open(args.since_report, 'r', encoding='utf-8') as f:
+            previous_report = json.load(f)
+    
+    # Los reportes se escriben en scraper/
+    Path("scraper").mkdir(exist_ok=True)
+    json_report = "scraper/scraping_report.json"
+    csv_report = "scraper/productos_scrapeados.csv"
+    
+    report_writer = ReportWriter(scraper.csv_rows, "scraper/productos.jsonl", csv_report) if args.stream_reports else None
+    try:
+        results = scraper.scrape_products(dry_run=args.dry_run, max_products=args.max_products,
+                                          previous_report=previous_report, report_writer=report_writer)
+    finally:
+        journal.close()
+        if report_writer:
+            report_writer.close()
+        if image_processor:
+            image_processor.close()
     
     # Mostrar resumen
     print("\n" + "="*50)
@@ -486,9 +2716,31 @@ def main():
     print(f"📦 Total productos: {results['total_products']}")
     print(f"🖼️  Total imágenes: {results['total_images']}")
     print(f"❌ Errores: {len(results['errors'])}")
+    print(f"🔁 Recuperados tras reintento: {len(results['recovered'])}")
+    if 'downloads' in results:
+        downloads = results['downloads']
+        print(f"⬇️  Descargas: {downloads['completed']}/{downloads['submitted']} ({downloads['failed']} fallidas)")
+    if image_processor:
+        derivative_stats = image_processor.stats()
+        print(f"🪄 Derivados: {derivative_stats['generated']} generados, {derivative_stats['skipped']} sin cambios, "
+              f"{derivative_stats['failed']} fallidos")
+    if scraper.content_store:
+        store_stats = scraper.content_store.stats()
+        print(f"🗃️  Almacén: {store_stats['new_blobs']} imágenes nuevas, {store_stats['reused']} reutilizadas, "
+              f"{store_stats['indexed_urls']} URLs indexadas")
+    connection_stats = scraper.connection_stats()
+    if 'connections' in connection_stats:
+        print(f"🔌 Conexiones: {connection_stats['connections']} abiertas para {connection_stats['requests']} requests "
+              f"({connection_stats['reused']} reutilizadas)")
+    else:
+        protocols = ', '.join(f"{name}: {count}" for name, count in connection_stats['protocols'].items())
+        print(f"🔌 Requests: {connection_stats['requests']} ({protocols})")
+    if scraper.cache:
+        cache_stats = scraper.cache.stats()
+        print(f"💾 Caché HTTP: {cache_stats['hits']} aciertos (304), {cache_stats['misses']} descargas completas")
     
-    # Mostrar detalle de productos
-    for category in results['categories']:
+    # Mostrar detalle de productos (en modo stream los productos sólo están en el JSONL)
+    for category in ([] if args.quiet or report_writer else results['categories']):
         print(f"\n📂 {category['name']}: {len(category['products'])} productos")
         for product in category['products']:
             print(f"  📦 {product['name']}")
@@ -499,23 +2751,54 @@ def main():
             if not args.dry_run:
                 print(f"     ⬇️  Descargadas: {len(product['downloaded_images'])}")
     
-    # Guardar reportes
-    json_report = "scraper/scraping_report.json"
-    csv_report = "scraper/productos_scrapeados.csv"
+    # Guardar reporte JSON
+    with scraper.profiler.stage('save_json_report'):
+        if report_writer:
+            # Armado desde scraper/productos.jsonl sin cargar el catálogo
+            report_writer.build_json_report(results, json_report)
+        else:
+            with open(json_report, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
     
-    # Crear directorio scraper si no existe
-    Path("scraper").mkdir(exist_ok=True)
+    # Guardar reporte CSV (en modo stream ya se escribió fila por fila)
+    if report_writer:
+        print(f"✅ CSV guardado con {report_writer.rows} filas")
+    else:
+        scraper.save_csv_report(results, csv_report)
     
-    # Guardar reporte JSON
-    with open(json_report, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    # Exportación del catálogo como upserts en lote
+    for export_path, sink in [(args.export_sql, 'sql'), (args.export_sqlite, 'sqlite')]:
+        if not export_path:
+            continue
+        if report_writer:
+            records = report_writer.records()
+        else:
+            records = ((category, product) for category in results['categories'] for product in category['products'])
+        exporter = CatalogExporter(results['categories'], records, batch_size=args.export_batch)
+        with scraper.profiler.stage(f'export_{sink}'):
+            if sink == 'sql':
+                exporter.write_sql(export_path)
+            else:
+                exporter.write_sqlite(export_path)
+        counts = exporter.counts
+        print(f"🗄️  Exportado a {export_path}: {counts['categories']} categorías, {counts['products']} productos, "
+              f"{counts['variants']} variantes, {counts['images']} imágenes, "
+              f"{counts['skipped']} omitidos (página no obtenida)")
     
-    # Guardar reporte CSV
-    scraper.save_csv_report(results, csv_report)
+    # Perfil de la ejecución por etapa
+    profile_report = "scraper/run_profile.json"
+    with open(profile_report, 'w', encoding='utf-8') as f:
+        json.dump(scraper.profiler.to_dict(), f, indent=2)
+    if args.prometheus:
+        with open("scraper/run_profile.prom", 'w', encoding='utf-8') as f:
+            f.write(scraper.profiler.to_prometheus())
     
     print(f"\n📄 Reportes guardados en:")
     print(f"   📊 JSON: {json_report}")
     print(f"   📈 CSV: {csv_report}")
+    if report_writer:
+        print(f"   🧾 JSONL: {report_writer.jsonl_path}")
+    print(f"   ⏱️  Perfil: {profile_report}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark de parsers para el scraper de Estudio Artesana
+Compara html.parser contra lxml, con y sin parseo restringido (SoupStrainer),
+sobre páginas de producto guardadas en disco
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+from artesana_scraper import ArtesanaScraper
+
+DEFAULT_FIXTURES = [Path(__file__).resolve().parent.parent / 'tests' / 'monedero_motita_page.html']
+
+def run_case(scraper: ArtesanaScraper, pages: List[bytes], restricted: bool, iterations: int) -> Dict:
+    """Parsea y extrae todas las páginas `iterations` veces; devuelve páginas/s y pico de memoria"""
+    parse_only = scraper.rules.strainer if restricted else None
+    product = {'name': 'benchmark'}
+
+    # Pico de memoria de una sola pasada
+    tracemalloc.start()
+    for content in pages:
+        scraper.extract_product_data(scraper.parse_html(content, parse_only), product)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for content in pages:
+            scraper.extract_product_data(scraper.parse_html(content, parse_only), product)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pages_per_second': (len(pages) * iterations) / elapsed if elapsed else 0.0,
+        'peak_memory_mb': peak / (1024 * 1024)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de parsers HTML del scraper')
+    parser.add_argument('fixtures', nargs='*', help='Archivos HTML de producto (default: tests/monedero_motita_page.html)')
+    parser.add_argument('--iterations', type=int, default=10, help='Repeticiones por caso (default: 10)')
+
+    args = parser.parse_args()
+
+    fixtures = [Path(f) for f in args.fixtures] or DEFAULT_FIXTURES
+    pages = [f.read_bytes() for f in fixtures]
+    total_kb = sum(len(p) for p in pages) / 1024
+    print(f"📄 {len(pages)} páginas ({total_kb:.0f} KB), {args.iterations} iteraciones")
+
+    print(f"\n{'backend':<12} {'modo':<12} {'páginas/s':>10} {'pico MB':>9}")
+    for backend in ['html.parser', 'lxml']:
+        scraper = ArtesanaScraper(cache_dir=None, parser=backend, quiet=True)
+        for restricted in [False, True]:
+            result = run_case(scraper, pages, restricted, args.iterations)
+            mode = 'restringido' if restricted else 'completo'
+            print(f"{backend:<12} {mode:<12} {result['pages_per_second']:>10.1f} {result['peak_memory_mb']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end del scraper de Estudio Artesana sin tocar el sitio real
+Levanta una tienda WooCommerce sintética en localhost (categorías paginadas,
+productos con swatches cfvsw, galería e imágenes de tamaño configurable, con
+latencia y errores inyectados) y corre ArtesanaScraper.scrape_products contra
+ella con distintos niveles de concurrencia
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from artesana_scraper import ArtesanaScraper
+
+class SyntheticShop:
+    """Genera el HTML y las imágenes de la tienda sintética"""
+
+    def __init__(self, categories: int = 5, products: int = 20, variants: int = 4,
+                 image_kb: int = 200, per_page: int = 12):
+        self.categories = categories
+        self.products = products
+        self.variants = variants
+        self.image_bytes = image_kb * 1024
+        self.per_page = per_page
+
+    def page(self, path: str) -> bytes:
+        """HTML para la ruta pedida, o None si no existe"""
+        parts = [part for part in path.split('/') if part]
+        if parts == ['tienda']:
+            links = ''.join(f'<li><a href="/product-category/categoria-{c}/">Categoria {c}</a></li>'
+                            for c in range(self.categories))
+            return self._html(f'<ul class="product-categories">{links}</ul>')
+
+        if len(parts) >= 2 and parts[0] == 'product-category':
+            category = parts[1]
+            page = int(parts[3]) if len(parts) >= 4 and parts[2] == 'page' else 1
+            pages = max(1, -(-self.products // self.per_page))
+            start = (page - 1) * self.per_page
+            items = ''.join(
+                f'<li class="product"><a href="/product/{category}-producto-{p}/">Producto {p} MXN $480.00</a></li>'
+                for p in range(start, min(start + self.per_page, self.products))
+            )
+            pagination = ''.join(f'<a class="page-numbers" href="/product-category/{category}/page/{n}/">{n}</a>'
+                                 for n in range(2, pages + 1))
+            return self._html(f'<ul class="products">{items}</ul><nav>{pagination}</nav>')
+
+        if len(parts) == 2 and parts[0] == 'product':
+            slug = parts[1]
+            swatches = ''.join(
+                f"<div class='cfvsw-swatches-option' data-slug='color-{v}' data-title='Color {v}'>"
+                f"<div class=\"cfvsw-swatch-inner\" style=\"background-image:url('/wp-content/uploads/{slug}-{v}.jpg');\">"
+                f"</div></div>"
+                for v in range(self.variants)
+            )
+            gallery = (f'<div class="woocommerce-product-gallery">'
+                       f'<img src="/wp-content/uploads/{slug}-principal.jpg"></div>')
+            # Relleno para que la página pese como una real de WooCommerce
+            filler = '<p>' + 'Lorem ipsum dolor sit amet. ' * 400 + '</p>'
+            return self._html(f'<h1 class="product_title">{slug}</h1>{gallery}'
+                              f'<div class="cfvsw-swatches-container">{swatches}</div>{filler}')
+        return None
+
+    def image(self, path: str) -> bytes:
+        # Contenido distinto por ruta para que el almacén por contenido no lo colapse
+        seed = path.encode('utf-8')
+        return (seed * (self.image_bytes // len(seed) + 1))[:self.image_bytes]
+
+    def _html(self, body: str) -> bytes:
+        return f'<!DOCTYPE html><html><head><title>Tienda</title></head><body>{body}</body></html>'.encode('utf-8')
+
+def serve(shop: SyntheticShop, latency_ms: float, error_rate: float, port_queue) -> None:
+    """Proceso servidor: atiende hasta que el benchmark lo termine"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            if error_rate and random.random() < error_rate:
+                self._send(503, b'', 'text/plain', {'Retry-After': '0'})
+                return
+
+            if self.path.startswith('/wp-content/uploads/'):
+                self._send(200, shop.image(self.path), 'image/jpeg')
+                return
+
+            body = shop.page(self.path)
+            if body is None:
+                self._send(404, b'', 'text/plain')
+            else:
+                self._send(200, body, 'text/html; charset=utf-8')
+
+        def _send(self, status: int, body: bytes, content_type: str, headers: Dict = None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def run_scrape(base_url: str, workers: int, args) -> Dict:
+    """Una corrida completa en un directorio temporal; devuelve las métricas"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='artesana-bench-') as workdir:
+        # El scraper escribe en ./scraper
+        os.chdir(workdir)
+        try:
+            scraper = ArtesanaScraper(base_url=base_url, delay=0, rate=args.rate, workers=workers,
+                                      download_workers=args.download_workers or workers,
+                                      cache_dir=None, parser=args.parser, use_sitemap=False,
+                                      backoff=0.05, quiet=True, processes=args.processes)
+            if args.memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            results = scraper.scrape_products(dry_run=args.dry_run, max_products=args.max_products)
+            wall_time = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+            if args.memory:
+                tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+
+    profile = scraper.profiler.to_dict()
+    downloaded = profile['stages'].get('download_image', {}).get('bytes', 0)
+    return {
+        'workers': workers,
+        'wall_time_s': round(wall_time, 3),
+        'products': results['total_products'],
+        'images': results['total_images'],
+        'products_per_second': round(results['total_products'] / wall_time, 2),
+        'images_per_second': round(results['total_images'] / wall_time, 2),
+        'mb_per_second': round(downloaded / (1024 * 1024) / wall_time, 2),
+        'errors': len(results['errors']),
+        'recovered': len(results['recovered']),
+        'peak_memory_mb': round(peak / (1024 * 1024), 1) if peak is not None else None,
+        'stages': profile['stages']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline del scraper contra una tienda sintética')
+    parser.add_argument('--categories', type=int, default=5, help='Categorías (default: 5)')
+    parser.add_argument('--products', type=int, default=20, help='Productos por categoría (default: 20)')
+    parser.add_argument('--variants', type=int, default=4, help='Variantes por producto (default: 4)')
+    parser.add_argument('--image-kb', type=int, default=200, help='Tamaño de cada imagen en KB (default: 200)')
+    parser.add_argument('--per-page', type=int, default=12, help='Productos por página de listado (default: 12)')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Latencia inyectada por request (default: 20)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de requests que responden 503 (default: 0)')
+    parser.add_argument('--workers', default='1,4,8', help='Niveles de concurrencia a comparar (default: 1,4,8)')
+    parser.add_argument('--download-workers', type=int, default=None, help='Hilos de descarga (default: igual a workers)')
+    parser.add_argument('--processes', type=int, default=1, help='Procesos del scraper (--processes) en cada corrida (default: 1)')
+    parser.add_argument('--rate', type=float, default=0, help='Límite de requests/s por host (default: sin límite)')
+    parser.add_argument('--parser', choices=['lxml', 'html.parser'], default='lxml', help='Backend de BeautifulSoup')
+    parser.add_argument('--max-products', type=int, default=None, help='Máximo de productos por corrida')
+    parser.add_argument('--dry-run', action='store_true', help='Sólo páginas, sin descargar imágenes')
+    parser.add_argument('--memory', action='store_true', help='Medir pico de memoria con tracemalloc (más lento)')
+    parser.add_argument('--json', default=None, help='Guardar los resultados en este archivo JSON')
+
+    args = parser.parse_args()
+
+    shop = SyntheticShop(args.categories, args.products, args.variants, args.image_kb, args.per_page)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(shop, args.latency_ms, args.error_rate, port_queue), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+    print(f"🏪 Tienda sintética en {base_url}: {args.categories} categorías × {args.products} productos × "
+          f"{args.variants} variantes, imágenes de {args.image_kb} KB, latencia {args.latency_ms} ms, "
+          f"errores {args.error_rate:.0%}")
+
+    runs = []
+    try:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            runs.append(run_scrape(base_url, workers, args))
+    finally:
+        server.terminate()
+
+    print(f"\n{'workers':>7} {'tiempo s':>9} {'prod/s':>8} {'img/s':>8} {'MB/s':>7} {'errores':>8} {'recup.':>7} {'pico MB':>8}")
+    for run in runs:
+        peak = f"{run['peak_memory_mb']:.1f}" if run['peak_memory_mb'] is not None else '-'
+        print(f"{run['workers']:>7} {run['wall_time_s']:>9.2f} {run['products_per_second']:>8.1f} "
+              f"{run['images_per_second']:>8.1f} {run['mb_per_second']:>7.1f} {run['errors']:>8} "
+              f"{run['recovered']:>7} {peak:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'runs': runs}, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()